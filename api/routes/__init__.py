@@ -1,4 +1,4 @@
 # ==================== api/routes/__init__.py ====================
-from . import stream, download
+from . import stream, download, hls
 
-__all__ = ['stream', 'download']
\ No newline at end of file
+__all__ = ['stream', 'download', 'hls']
\ No newline at end of file
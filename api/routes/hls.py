@@ -0,0 +1,140 @@
+# ==================== api/routes/hls.py ====================
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+from database.operations import get_file_by_id, get_master_group_variants
+from config import config
+from api.streaming.fetcher import open_fetcher
+from api.utils import client_ip
+from bot.client import BotNotReady
+from api.streaming.admission import admit_stream
+from api.streaming.hls import is_source_request, master_playlist, media_playlist, plan_segments, remuxer, RemuxError
+from api.streaming.response import ChunkStreamingResponse
+from api.streaming.seekindex import seek_index
+from api.routes.stream import stream_file_direct
+import asyncio
+import re
+
+router = APIRouter(prefix="/hls")
+
+SEGMENT_CACHE_CONTROL = 'public, max-age=86400'
+
+async def load_segments(fileId: str):
+    """File, keyframe index and segment plan for a file served as HLS"""
+    if not re.match(r'^[a-f0-9]{24}$', fileId):
+        raise HTTPException(status_code=400, detail="Invalid file ID format")
+    if not remuxer.available:
+        raise HTTPException(status_code=404, detail="HLS is not enabled")
+
+    file_data = await get_file_by_id(fileId)
+    if not file_data:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not seek_index.indexable(file_data):
+        raise HTTPException(status_code=404, detail="HLS is only generated for MKV and MP4 files")
+
+    try:
+        index = await seek_index.require(file_data)
+    except BotNotReady:
+        raise HTTPException(status_code=503, detail="Bot service not ready")
+    except Exception as e:
+        print(f"[HLS] Could not index {fileId}: {e!r}")
+        raise
+    if index is None:
+        raise HTTPException(status_code=404, detail="File has no keyframe index")
+
+    segments = plan_segments(index, file_data.get('size', 0), config.HLS_SEGMENT_SECONDS)
+    if not segments:
+        raise HTTPException(status_code=404, detail="File has no keyframe index")
+    return file_data, index, segments
+
+async def _single(chunk):
+    yield chunk
+
+@router.get("/master/{masterGroupId}.m3u8")
+async def hls_master(masterGroupId: str):
+    """Every quality of a master group as one adaptive stream"""
+    if not re.match(r'^[a-f0-9]{24}$', masterGroupId):
+        raise HTTPException(status_code=400, detail="Invalid master group ID format")
+    if not remuxer.available:
+        raise HTTPException(status_code=404, detail="HLS is not enabled")
+
+    files = [f for f in await get_master_group_variants(masterGroupId) if seek_index.indexable(f)]
+    if not files:
+        raise HTTPException(status_code=404, detail="Master group not found")
+
+    # Each variant is cut at its own keyframes, from its index built once
+    indexes = await asyncio.gather(*(seek_index.require(f) for f in files), return_exceptions=True)
+    variants = [(f, index) for f, index in zip(files, indexes) if index and not isinstance(index, Exception)]
+    if not variants:
+        raise HTTPException(status_code=503, detail="Keyframe indexes not ready")
+
+    return Response(
+        content=master_playlist(variants),
+        media_type='application/vnd.apple.mpegurl',
+        headers={'Cache-Control': 'no-cache'}
+    )
+
+@router.get("/{fileId}/index.m3u8")
+async def hls_playlist(fileId: str):
+    _, _, segments = await load_segments(fileId)
+    return Response(
+        content=media_playlist(segments),
+        media_type='application/vnd.apple.mpegurl',
+        headers={'Cache-Control': 'no-cache'}
+    )
+
+@router.api_route("/{fileId}/source", methods=["GET", "HEAD"])
+async def hls_source(fileId: str, request: Request, key: str = ''):
+    """
+    The file as ffmpeg reads it for MP4 remuxing: ranged, unpaced, not
+    counted as a view. Admission was taken by the segment request that
+    started the remux, so these reads don't queue behind it; anyone but
+    our own ffmpeg gets a 404.
+    """
+    # The socket peer, not client_ip(): a proxied request arrives from loopback too, but without the key
+    if not is_source_request(request.client.host if request.client else '', key):
+        raise HTTPException(status_code=404, detail="Not found")
+    if not re.match(r'^[a-f0-9]{24}$', fileId):
+        raise HTTPException(status_code=400, detail="Invalid file ID format")
+    file_data = await get_file_by_id(fileId)
+    if not file_data or not file_data.get('telegramFileId'):
+        raise HTTPException(status_code=404, detail="File not found")
+    return await stream_file_direct(file_data, request, internal=True)
+
+@router.get("/{fileId}/init.mp4")
+async def hls_init(fileId: str, request: Request):
+    return await _serve(fileId, request, None)
+
+@router.get("/{fileId}/{number}.m4s")
+async def hls_segment(fileId: str, number: int, request: Request):
+    return await _serve(fileId, request, number)
+
+async def _serve(fileId: str, request: Request, number):
+    file_data, index, segments = await load_segments(fileId)
+    if number is not None and not 1 <= number <= len(segments):
+        raise HTTPException(status_code=404, detail="Segment not found")
+    ip = client_ip(request)
+    ticket = await admit_stream(ip)
+    try:
+        fetch_part = await open_fetcher(file_data, client_ip=ip)
+        if number is None:
+            data = await remuxer.init_segment(file_data, fetch_part, index, segments)
+        else:
+            data = await remuxer.segment(file_data, fetch_part, index, segments[number - 1])
+            # Keep the next segments remuxed before the player asks for them
+            remuxer.ahead(file_data, fetch_part, index, segments, number)
+    except RemuxError as e:
+        print(f"[HLS] Remux of {fileId} segment {number or 'init'} failed: {e}")
+        raise HTTPException(status_code=502, detail="Remux failed")
+    except BotNotReady:
+        raise HTTPException(status_code=503, detail="Bot service not ready")
+    except Exception as e:
+        print(f"[HLS] Error serving {fileId} segment {number or 'init'}: {e!r}")
+        raise
+    finally:
+        ticket.release()
+
+    return ChunkStreamingResponse(
+        _single(data),
+        media_type='video/mp4' if number is None else 'video/iso.segment',
+        headers={'Content-Length': str(len(data)), 'Cache-Control': SEGMENT_CACHE_CONTROL}
+    )
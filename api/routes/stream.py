@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException, Request, Query
-from fastapi.responses import StreamingResponse, HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 <<<<<<< HEAD
 from database.operations import (
     get_file_by_id, increment_views, get_files_by_basename,
@@ -8,15 +8,23 @@ from database.operations import (
 =======
 from database.operations import get_file_by_id, increment_views, get_files_by_basename
 >>>>>>> origin/main
-from bot.client import get_bot
 from config import config
-from pyrogram import raw
-from pyrogram.file_id import FileId, FileType, ThumbnailSource
-from pyrogram.session import Session, Auth
-from pyrogram import utils as pyro_utils
 import re
-import math
+from contextlib import aclosing
 from utils.master_id import generate_master_group_id
+from api.streaming.ranges import RangeNotSatisfiable, plan_response, stream_ranges
+from api.streaming.fetcher import open_fetcher
+from api.utils import client_ip
+from bot.client import BotNotReady
+from api.streaming.admission import admit_page, admit_stream
+from api.streaming.response import ChunkStreamingResponse, until_disconnected
+from api.streaming.conditional import make_etag, not_modified, range_applies
+from api.streaming.pacing import paced, playback_rate
+from api.streaming.stream_sessions import stream_sessions
+from api.streaming.prefetch import start_prefetch
+from api.streaming.faststart import faststart, is_mp4, virtual_fetch
+from api.streaming.seekindex import seek_index
+from api.streaming.hls import remuxer
 
 router = APIRouter()
 
@@ -58,14 +66,30 @@ def get_artplayer_config_with_quality(file_id: str, stream_url: str, file_name:
     
     controls_config += "\n    ]"
     
+    player_url = stream_url
+    hls_type = None
+    adaptive = bool(is_master_mode and master_group_id and remuxer.available) \
+        and (is_mkv or is_mp4({'fileName': file_name}))
+    if adaptive:
+        # All qualities as one HLS stream, so switching doesn't restart the download
+        player_url = f"{config.BASE_APP_URL}/hls/master/{master_group_id}.m3u8"
+        hls_type = 'm3u8'
+    elif is_mkv:
+        # Browsers can't demux Matroska: play it through the fMP4 HLS remux
+        hls_type = 'mkv'
+        if remuxer.available:
+            player_url = f"{config.BASE_APP_URL}/hls/{file_id}/index.m3u8"
+            hls_type = 'm3u8'
+    
     mkv_custom_type = ""
-    if is_mkv:
+    if hls_type:
         mkv_custom_type = """customType: {
-            mkv: (video, url) => {
+            """ + hls_type + """: (video, url) => {
                 if (Hls.isSupported()) {
                     const hls = new Hls({ enableWorker: true, lowLatencyMode: true, backBufferLength: 90 });
                     hls.loadSource(url);
                     hls.attachMedia(video);
+                    window.hlsPlayer = hls;
                     hls.on(Hls.Events.MANIFEST_PARSED, () => { console.log('HLS manifest loaded'); });
                     if (hls.audioTracks && hls.audioTracks.length > 1) { window.hlsInstance = hls; }
                 } else if (video.canPlayType('application/x-mpegURL')) {
@@ -80,7 +104,7 @@ def get_artplayer_config_with_quality(file_id: str, stream_url: str, file_name:
     return f"""
         const art = new Artplayer({{
             container: '#artplayer',
-            url: '{stream_url}',
+            url: '{player_url}',
             title: '{file_name}',
             volume: 0.8,
             autoplay: false,
@@ -176,6 +200,18 @@ def get_artplayer_config_with_quality(file_id: str, stream_url: str, file_name:
                     icon: '<i class="fas fa-sliders"></i>',
                     selector: qualityOptions,
                     onSelect: function (item) {{
+                        const newUrl = {'`/watch/master/${master_group_id}?quality=${item.quality}`' if is_master_mode else '`/watch/${item.value}`'};
+                        
+                        // Adaptive stream: pick the variant in place, keeping the buffer
+                        const level = window.hlsPlayer && {'true' if adaptive else 'false'}
+                            ? window.hlsPlayer.levels.findIndex(l => l.name === item.quality) : -1;
+                        if (level >= 0) {{
+                            window.hlsPlayer.nextLevel = level;
+                            art.notice.show = `<i class="fas fa-sliders"></i> Switched to ${{item.quality}}`;
+                            window.history.replaceState(null, '', newUrl);
+                            return item.html;
+                        }}
+                        
                         const currentTime = art.currentTime;
                         const wasPlaying = !art.paused;
                         
@@ -191,7 +227,6 @@ def get_artplayer_config_with_quality(file_id: str, stream_url: str, file_name:
                         art.notice.show = `<i class="fas fa-sliders"></i> Switched to ${{item.quality}}`;
                         
                         // Update URL without reload
-                        const newUrl = {'`/watch/master/${master_group_id}?quality=${item.quality}`' if is_master_mode else '`/watch/${item.value}`'};
                         window.history.replaceState(null, '', newUrl);
                         
                         return item.html;
@@ -372,7 +407,7 @@ def get_tap_functionality_script():
         });
     """
 
-@router.get("/{fileId}")
+@router.api_route("/{fileId}", methods=["GET", "HEAD"])
 async def stream_file(fileId: str, request: Request):
     if not re.match(r'^[a-f0-9]{24}$', fileId):
         raise HTTPException(status_code=400, detail="Invalid file ID format")
@@ -385,109 +420,135 @@ async def stream_file(fileId: str, request: Request):
     if not telegram_file_id:
         raise HTTPException(status_code=404, detail="Telegram file ID not found")
     
-    await increment_views(fileId)
+    if request.method == "GET":
+        await increment_views(fileId)
     
     return await stream_file_direct(file_data, request)
 
-async def stream_file_direct(file_data: dict, request: Request):
-    try:
-        bot_client = get_bot()
-    except Exception:
-        raise HTTPException(status_code=503, detail="Bot service not ready")
-    
-    telegram_file_id = file_data.get('telegramFileId')
+async def stream_file_direct(file_data: dict, request: Request, internal: bool = False):
+    """
+    Serve a file with range, conditional and faststart handling. `internal`
+    reads (ffmpeg remuxing for a segment request that already holds an
+    admission slot) skip admission and pacing.
+    """
     file_size = file_data.get('size', 0)
     mime_type = file_data.get('mimeType', 'video/mp4')
     file_name = file_data.get('fileName', 'file')
+    unique_id = file_data.get('telegramFileUniqueId')
     
-    range_header = request.headers.get('range', '')
+    # MP4s with moov at the end are served with moov moved to the front
+    use_faststart = faststart.enabled and unique_id and is_mp4(file_data)
+    etag = make_etag(file_data, 'faststart' if use_faststart else None)
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={'ETag': etag, 'Accept-Ranges': 'bytes'})
     
-    if range_header:
-        from_bytes, until_bytes = range_header.replace("bytes=", "").split("-")
-        from_bytes = int(from_bytes)
-        until_bytes = int(until_bytes) if until_bytes else file_size - 1
-    else:
-        from_bytes = 0
-        until_bytes = file_size - 1
+    # ?t=<seconds> reports the keyframe at or before t; the body is unchanged,
+    # since bytes from mid-container aren't playable without the headers.
+    # A player seeks there with its own Range request.
+    keyframe = None
+    if request.query_params.get('t'):
+        try:
+            seconds = float(request.query_params['t'])
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid seek time")
+        index = await seek_index.get(file_data)
+        keyframe = index.keyframe(seconds) if index else None
     
-    if (until_bytes > file_size) or (from_bytes < 0) or (until_bytes < from_bytes):
-        raise HTTPException(status_code=416, detail="Range not satisfiable")
+    def respond(etag, shifted: bool):
+        """Response plan and headers for the byte layout `etag` names"""
+        range_header = request.headers.get('range', '') if range_applies(request, etag) else ''
+        try:
+            plan = plan_response(range_header, file_size, mime_type)
+        except RangeNotSatisfiable:
+            raise HTTPException(
+                status_code=416,
+                detail="Range not satisfiable",
+                headers={'Content-Range': f'bytes */{file_size}'}
+            )
+        
+        headers = plan.headers
+        headers['Content-Disposition'] = f'inline; filename="{file_name}"'
+        if etag:
+            headers['ETag'] = etag
+        if keyframe:
+            seek_time, offset = keyframe
+            headers['X-Seek-Time'] = f'{seek_time:.3f}'
+            headers['X-Seek-Offset'] = str(index.virtual(offset) if shifted else offset)
+        return plan, headers
     
-    chunk_size = 1024 * 1024
-    until_bytes = min(until_bytes, file_size - 1)
+    plan, headers = respond(etag, use_faststart)
     
-    offset = from_bytes - (from_bytes % chunk_size)
-    first_part_cut = from_bytes - offset
-    last_part_cut = until_bytes % chunk_size + 1
+    # HEAD is answered from Mongo metadata alone, without touching Telegram
+    if request.method == "HEAD":
+        return Response(status_code=plan.status_code, headers=headers)
     
-    req_length = until_bytes - from_bytes + 1
-    part_count = math.ceil(until_bytes / chunk_size) - math.floor(offset / chunk_size)
+    ip = client_ip(request)
+    ticket = None if internal else await admit_stream(ip)
+    try:
+        fetch_part = await open_fetcher(file_data, client_ip=ip)
+        if use_faststart:
+            try:
+                layout = await faststart.get(unique_id, fetch_part, file_size)
+            except Exception as e:
+                # Reading the moov failed this time; the file is still servable as stored,
+                # under its own ETag so If-Range can't mix the two layouts
+                print(f"[FASTSTART] Serving {unique_id} as stored: {e}")
+                layout = None
+                plan, headers = respond(make_etag(file_data), False)
+            if layout:
+                fetch_part = virtual_fetch(fetch_part, layout, file_size)
+    except BotNotReady:
+        if ticket:
+            ticket.release()
+        raise HTTPException(status_code=503, detail="Bot service not ready")
+    except BaseException:
+        if ticket:
+            ticket.release()
+        raise
     
-    file_id_obj = FileId.decode(telegram_file_id)
-    media_session = await get_media_session(bot_client, file_id_obj)
-    location = await get_location(file_id_obj)
+    # Long single-range playback carries its read-ahead over to the next request
+    session = None
+    if len(plan.ranges) == 1 and plan.ranges[0][1] - plan.ranges[0][0] >= config.STREAM_PRECISE_MAX_KB * 1024:
+        session = stream_sessions.get(ip, unique_id)
     
     async def file_stream():
-        nonlocal offset
-        current_part = 1
-        
+        chunks = stream_ranges(
+            fetch_part, plan.ranges, file_size, config.STREAM_READAHEAD,
+            mime_type=mime_type, boundary=plan.boundary, session=session
+        )
+        # Pace playback so viewers who leave early don't pull the whole file
+        rate = playback_rate(file_data)
+        if not internal and config.STREAM_PACE_AHEAD > 0 and rate and not plan.boundary:
+            chunks = paced(chunks, rate, config.STREAM_PACE_AHEAD)
         try:
-            r = await media_session.invoke(
-                raw.functions.upload.GetFile(location=location, offset=offset, limit=chunk_size)
-            )
-            
-            if isinstance(r, raw.types.upload.File):
-                while True:
-                    chunk = r.bytes
-                    if not chunk:
-                        break
-                    
-                    if part_count == 1:
-                        yield chunk[first_part_cut:last_part_cut]
-                    elif current_part == 1:
-                        yield chunk[first_part_cut:]
-                    elif current_part == part_count:
-                        yield chunk[:last_part_cut]
-                    else:
-                        yield chunk
-                    
-                    current_part += 1
-                    offset += chunk_size
-                    
-                    if current_part > part_count:
-                        break
-                    
-                    r = await media_session.invoke(
-                        raw.functions.upload.GetFile(location=location, offset=offset, limit=chunk_size)
-                    )
+            async with aclosing(until_disconnected(request, chunks)) as body:
+                async for chunk in body:
+                    yield chunk
         except Exception as e:
             print(f"Stream error: {e}")
             raise
     
-    headers = {
-        'Content-Type': mime_type,
-        'Accept-Ranges': 'bytes',
-        'Content-Length': str(req_length),
-        'Content-Disposition': f'inline; filename="{file_name}"'
-    }
-    
-    if range_header:
-        headers['Content-Range'] = f'bytes {from_bytes}-{until_bytes}/{file_size}'
-        status_code = 206
-    else:
-        status_code = 200
-    
-    return StreamingResponse(file_stream(), status_code=status_code, headers=headers, media_type=mime_type)
+    return ChunkStreamingResponse(
+        file_stream(),
+        status_code=plan.status_code,
+        headers=headers,
+        media_type=headers['Content-Type'],
+        on_close=ticket.release if ticket else None
+    )
 
 @router.get("/watch/{fileId}")
 async def watch_file(fileId: str, request: Request):
     if not re.match(r'^[a-f0-9]{24}$', fileId):
         raise HTTPException(status_code=400, detail="Invalid file ID")
     
+    admit_page()
+    
     file_data = await get_file_by_id(fileId)
     if not file_data:
         raise HTTPException(status_code=404, detail="File not found")
     
+    start_prefetch(file_data, client_ip(request))
+    
     file_name = file_data.get('fileName', 'Video')
     base_name = file_data.get('baseName', file_name)
     stream_url = f"{config.BASE_APP_URL}/{fileId}"
@@ -714,6 +775,8 @@ async def watch_master_group(masterGroupId: str, request: Request, quality: str
     if not re.match(r'^[a-f0-9]{24}$', masterGroupId):
         raise HTTPException(status_code=400, detail="Invalid master group ID format")
     
+    admit_page()
+    
 <<<<<<< HEAD
     # Get all files with this master group ID
     matched_files = await get_files_by_master_group_id(masterGroupId)
@@ -758,6 +821,7 @@ async def watch_master_group(masterGroupId: str, request: Request, quality: str
     views = target_file.get('views', 0)
     is_mkv = file_name.lower().endswith('.mkv')
     
+    start_prefetch(target_file, client_ip(request))
     await increment_views(file_id)
     
     artplayer_config = get_artplayer_config_with_quality(
@@ -968,6 +1032,8 @@ async def embed_master_group(masterGroupId: str, request: Request, quality: str
     if not re.match(r'^[a-f0-9]{24}$', masterGroupId):
         raise HTTPException(status_code=400, detail="Invalid master group ID format")
     
+    admit_page()
+    
     matched_files = await get_files_by_master_group_id(masterGroupId)
     
 =======
@@ -976,10 +1042,14 @@ async def embed_file(fileId: str, request: Request):
     if not re.match(r'^[a-f0-9]{24}$', fileId):
         raise HTTPException(status_code=400, detail="Invalid file ID")
 
+    admit_page()
+
     file_data = await get_file_by_id(fileId)
     if not file_data:
         raise HTTPException(status_code=404, detail="File not found")
 
+    start_prefetch(file_data, client_ip(request))
+
     file_name = file_data.get('fileName', 'Video')
     stream_url = f"{config.BASE_APP_URL}/{fileId}"
     download_url = f"{config.BASE_APP_URL}/dl/{fileId}"
@@ -1061,6 +1131,8 @@ async def embed_master_group(masterGroupId: str, request: Request, quality: str
     if not re.match(r'^[a-f0-9]{24}$', masterGroupId):
         raise HTTPException(status_code=400, detail="Invalid master group ID format")
 
+    admit_page()
+
     db = get_database()
     
     all_files = await db.files.find({}).to_list(length=None)
@@ -1094,6 +1166,7 @@ async def embed_master_group(masterGroupId: str, request: Request, quality: str
     download_url = f"{config.BASE_APP_URL}/dl/{file_id}"
     is_mkv = file_name.lower().endswith('.mkv')
     
+    start_prefetch(target_file, client_ip(request))
     await increment_views(file_id)
     
     artplayer_config = get_artplayer_config_with_quality(
@@ -1164,33 +1237,3 @@ async def embed_master_group(masterGroupId: str, request: Request, quality: str
 </html>"""
     
     return HTMLResponse(content=html)
-
-async def get_media_session(client, file_id: FileId):
-    dc_id = file_id.dc_id
-    if not hasattr(client, 'media_sessions'):
-        client.media_sessions = {}
-    if dc_id in client.media_sessions:
-        return client.media_sessions[dc_id]
-    
-    if dc_id != await client.storage.dc_id():
-        media_session = Session(client, dc_id, await Auth(client, dc_id, await client.storage.test_mode()).create(), await client.storage.test_mode(), is_media=True)
-        await media_session.start()
-        for _ in range(6):
-            try:
-                exported = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc_id))
-                await media_session.invoke(raw.functions.auth.ImportAuthorization(id=exported.id, bytes=exported.bytes))
-                break
-            except:
-                continue
-        client.media_sessions[dc_id] = media_session
-        return media_session
-    else:
-        media_session = Session(client, dc_id, await client.storage.auth_key(), await client.storage.test_mode(), is_media=True)
-        await media_session.start()
-        client.media_sessions[dc_id] = media_session
-        return media_session
-
-async def get_location(file_id: FileId):
-    if file_id.file_type == FileType.PHOTO:
-        return raw.types.InputPhotoFileLocation(id=file_id.media_id, access_hash=file_id.access_hash, file_reference=file_id.file_reference, thumb_size=file_id.thumbnail_size)
-    return raw.types.InputDocumentFileLocation(id=file_id.media_id, access_hash=file_id.access_hash, file_reference=file_id.file_reference, thumb_size=file_id.thumbnail_size)
\ No newline at end of file
@@ -0,0 +1,171 @@
+# ==================== api/streaming/admission.py ====================
+import asyncio
+from collections import Counter, deque
+from typing import Optional
+
+from fastapi import HTTPException
+
+from config import config
+from api.streaming.sessions import total_outstanding
+
+RETRY_AFTER = 5  # seconds suggested to rejected clients
+LAG_INTERVAL = 0.5
+
+class Overloaded(Exception):
+    pass
+
+
+class Ticket:
+    """A stream's admission slot; release() is safe to call more than once"""
+
+    def __init__(self, controller: "AdmissionController", client: str):
+        self.controller = controller
+        self.client = client
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._leave(self.client)
+
+
+class AdmissionController:
+    """
+    Decides whether a new stream may start.
+
+    Streams hold a slot for their whole lifetime, bounded globally and per
+    client IP. Requests over the limit wait in a bounded FIFO queue for a
+    slot to free up. New work is shed outright while the event loop lags
+    or too many GetFile requests are already in flight, so streams that
+    are already running keep their throughput at peak.
+    """
+
+    def __init__(self, max_streams: int, max_per_client: int, queue_size: int, queue_timeout: float):
+        self.max_streams = max_streams
+        self.max_per_client = max_per_client
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.loop_lag = 0.0
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+        self._per_client = Counter()
+        self._waiters = deque()  # (client, future)
+        self._lag_task = None
+
+    def _has_room(self, client: str) -> bool:
+        if self.max_streams > 0 and self.active >= self.max_streams:
+            return False
+        return self.max_per_client <= 0 or self._per_client[client] < self.max_per_client
+
+    def _enter(self, client: str) -> Ticket:
+        self.active += 1
+        self._per_client[client] += 1
+        self.admitted += 1
+        return Ticket(self, client)
+
+    def _leave(self, client: str):
+        self.active -= 1
+        self._per_client[client] -= 1
+        if not self._per_client[client]:
+            del self._per_client[client]
+        self._wake()
+
+    def _wake(self):
+        for entry in list(self._waiters):
+            client, future = entry
+            if future.done():
+                self._waiters.remove(entry)
+            elif self._has_room(client):
+                self._waiters.remove(entry)
+                future.set_result(self._enter(client))
+
+    def overloaded(self) -> Optional[str]:
+        """Why new work should be shed right now, or None"""
+        if self._lag_task is None or self._lag_task.done():
+            self._lag_task = asyncio.ensure_future(self._watch_lag())
+        if config.ADMISSION_MAX_LOOP_LAG_MS > 0 and self.loop_lag * 1000 > config.ADMISSION_MAX_LOOP_LAG_MS:
+            return f"event loop lagging {self.loop_lag * 1000:.0f}ms"
+        if config.ADMISSION_MAX_UPSTREAM > 0 and total_outstanding() >= config.ADMISSION_MAX_UPSTREAM:
+            return "too many upstream requests in flight"
+        return None
+
+    async def acquire(self, client: str) -> Ticket:
+        reason = self.overloaded()
+        if reason:
+            self.shed += 1
+            raise Overloaded(reason)
+
+        if not self._waiters and self._has_room(client):
+            return self._enter(client)
+
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            raise Overloaded("stream queue full")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (client, future)
+        self._waiters.append(entry)
+        try:
+            return await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Overloaded("timed out waiting for a stream slot")
+        finally:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+
+    async def _watch_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            lag = loop.time() - started - LAG_INTERVAL
+            # Jump up at once, decay slowly, so one quiet tick doesn't reopen the gate
+            self.loop_lag = max(lag, self.loop_lag * 0.8)
+
+    def stats(self) -> dict:
+        return {
+            'active': self.active,
+            'queued': len(self._waiters),
+            'loopLagMs': round(self.loop_lag * 1000),
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'shed': self.shed,
+        }
+
+
+admission = AdmissionController(
+    config.ADMISSION_MAX_STREAMS,
+    config.ADMISSION_MAX_PER_IP,
+    config.ADMISSION_QUEUE_SIZE,
+    config.ADMISSION_QUEUE_TIMEOUT,
+)
+
+
+def _unavailable(reason: str) -> HTTPException:
+    print(f"[ADMISSION] Rejecting request: {reason}")
+    return HTTPException(
+        status_code=503,
+        detail="Server busy, please retry shortly",
+        headers={'Retry-After': str(RETRY_AFTER)}
+    )
+
+
+async def admit_stream(client: str) -> Ticket:
+    """Wait for a stream slot for `client`, or raise 503 with Retry-After"""
+    try:
+        return await admission.acquire(client)
+    except Overloaded as e:
+        raise _unavailable(str(e))
+
+
+def admit_page():
+    """Refuse new player pages while the server is shedding stream load"""
+    reason = admission.overloaded()
+    if reason is None and admission.queue_size and len(admission._waiters) >= admission.queue_size:
+        reason = "stream queue full"
+    if reason:
+        admission.shed += 1
+        raise _unavailable(reason)
@@ -0,0 +1,76 @@
+# ==================== api/streaming/buffers.py ====================
+import asyncio
+import time
+from typing import Union
+
+# Parts travel through the pipeline as bytes (fresh from Telegram) or as
+# memoryviews (cache hits and slices); both go to the socket as they are
+Chunk = Union[bytes, memoryview]
+
+REPORT_INTERVAL = 60
+
+class AllocationStats:
+    """
+    Tracks how many payload bytes the pipeline allocates versus hands out as views.
+
+    Every GetFile response is a fresh bytes object from pyrogram, which we
+    cannot avoid. Everything after that (cache hits, trimming parts to the
+    requested range) is handed to the response as a view of an existing
+    buffer rather than a new copy.
+    """
+
+    def __init__(self):
+        self.allocated = 0
+        self.viewed = 0
+        self._reported = (time.monotonic(), 0, 0)
+        self._report_task = None
+
+    def record_allocation(self, size: int):
+        self.allocated += size
+        self._ensure_reporting()
+
+    def record_delivery(self, chunk: Chunk):
+        if isinstance(chunk, memoryview):
+            self.viewed += len(chunk)
+
+    def _ensure_reporting(self):
+        if self._report_task is None or self._report_task.done():
+            self._report_task = asyncio.ensure_future(self._report_loop())
+
+    def rates(self) -> dict:
+        """Bytes per second allocated and viewed since the last report"""
+        since, allocated, viewed = self._reported
+        elapsed = max(time.monotonic() - since, 1e-6)
+        return {
+            'allocatedPerSec': (self.allocated - allocated) / elapsed,
+            'viewedPerSec': (self.viewed - viewed) / elapsed,
+        }
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(REPORT_INTERVAL)
+            rates = self.rates()
+            self._reported = (time.monotonic(), self.allocated, self.viewed)
+            if rates['allocatedPerSec'] or rates['viewedPerSec']:
+                print(
+                    f"[BUFFERS] allocating {rates['allocatedPerSec'] / (1024 * 1024):.1f}MB/s, "
+                    f"zero-copy {rates['viewedPerSec'] / (1024 * 1024):.1f}MB/s"
+                )
+
+    def stats(self) -> dict:
+        return {
+            'allocatedBytes': self.allocated,
+            'viewedBytes': self.viewed,
+            **self.rates(),
+        }
+
+
+allocations = AllocationStats()
+
+
+def view(chunk: Chunk, start: int, end: int) -> Chunk:
+    """Bytes `start`..`end` of `chunk` without copying them"""
+    end = min(end, len(chunk))
+    if start == 0 and end == len(chunk):
+        return chunk
+    return memoryview(chunk)[start:end]
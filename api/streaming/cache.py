@@ -0,0 +1,180 @@
+# ==================== api/streaming/cache.py ====================
+import asyncio
+import mmap
+import os
+from collections import OrderedDict
+from typing import Optional
+
+from config import config
+from api.streaming.readahead import FetchPart
+from api.streaming.planner import CHUNK_SIZE
+from api.streaming.buffers import Chunk, view
+
+class ChunkCache:
+    """
+    On-disk LRU cache of Telegram file parts.
+
+    Entries are stored as `<root>/<telegramFileUniqueId>/<offset>` and are read
+    back through mmap, so a hit hands the kernel page cache straight to the
+    response without copying the part into a Python bytes object.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._index: "OrderedDict[tuple, int]" = OrderedDict()
+        self._loaded = False
+        self._writing = set()
+        self._writes = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, unique_id: str, offset: int) -> str:
+        return os.path.join(self.root, unique_id, str(offset))
+
+    def _load_index(self):
+        """Rebuild the LRU order from whatever survived the last run"""
+        self._loaded = True
+        if not os.path.isdir(self.root):
+            return
+
+        entries = []
+        for file_dir in os.scandir(self.root):
+            if not file_dir.is_dir():
+                continue
+            for entry in os.scandir(file_dir.path):
+                if not entry.name.isdigit():
+                    continue
+                st = entry.stat()
+                entries.append((st.st_mtime, (file_dir.name, int(entry.name)), st.st_size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self.total_bytes += size
+
+        print(f"[CACHE] Loaded {len(self._index)} chunks ({self.total_bytes / (1024 * 1024):.1f}MB) from {self.root}")
+        self._evict()
+
+    def get(self, unique_id: str, offset: int) -> Optional[memoryview]:
+        """Return a zero-copy view of a cached part, or None on a miss"""
+        if not self.enabled:
+            return None
+        if not self._loaded:
+            self._load_index()
+
+        key = (unique_id, offset)
+        if key not in self._index:
+            self.misses += 1
+            return None
+
+        try:
+            with open(self._path(unique_id, offset), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.total_bytes -= self._index.pop(key)
+            self.misses += 1
+            return None
+
+        self._index.move_to_end(key)
+        self.hits += 1
+        return memoryview(mapped)
+
+    def contains(self, unique_id: str, offset: int) -> bool:
+        if not self.enabled:
+            return False
+        if not self._loaded:
+            self._load_index()
+        return (unique_id, offset) in self._index
+
+    async def put(self, unique_id: str, offset: int, data: Chunk):
+        """Store a part and evict least recently used parts over budget"""
+        if not self.enabled or not data:
+            return
+        if not self._loaded:
+            self._load_index()
+
+        key = (unique_id, offset)
+        if key in self._index or key in self._writing:
+            return
+
+        self._writing.add(key)
+        try:
+            await asyncio.to_thread(self._write, self._path(unique_id, offset), data)
+        except OSError as e:
+            print(f"[CACHE] Failed to write chunk {unique_id}@{offset}: {e}")
+            return
+        finally:
+            self._writing.discard(key)
+
+        self._index[key] = len(data)
+        self.total_bytes += len(data)
+        self._evict()
+
+    def put_later(self, unique_id: str, offset: int, data: Chunk):
+        """Schedule a put without making the caller wait for the disk"""
+        if not self.enabled:
+            return
+        task = asyncio.ensure_future(self.put(unique_id, offset, data))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    @staticmethod
+    def _write(path: str, data: Chunk):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._index:
+            (unique_id, offset), size = self._index.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                # Open mmaps of this part stay valid after unlink
+                os.remove(self._path(unique_id, offset))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'chunks': len(self._index),
+            'bytes': self.total_bytes,
+            'maxBytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+chunk_cache = ChunkCache(config.CHUNK_CACHE_DIR, config.CHUNK_CACHE_MAX_MB * 1024 * 1024)
+
+
+def cached_fetch(
+    fetch: FetchPart,
+    unique_id: Optional[str],
+    cache: ChunkCache = chunk_cache,
+    fill: bool = True,
+) -> FetchPart:
+    """Wrap a part fetcher so it reads from (and with `fill`, fills) `cache`"""
+    if not unique_id or not cache.enabled:
+        return fetch
+
+    async def fetch_part(offset: int, limit: int) -> Chunk:
+        # Smaller precise parts are served from the 1MB block containing them
+        block = offset - offset % CHUNK_SIZE
+        hit = cache.get(unique_id, block)
+        if hit is not None:
+            return view(hit, offset - block, offset - block + limit)
+
+        data = await fetch(offset, limit)
+        if fill and limit == CHUNK_SIZE and offset == block and data:
+            cache.put_later(unique_id, offset, data)
+        return data
+
+    return fetch_part
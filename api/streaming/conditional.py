@@ -0,0 +1,38 @@
+# ==================== api/streaming/conditional.py ====================
+from typing import Optional
+
+from fastapi import Request
+
+def make_etag(file_data: dict, variant: Optional[str] = None) -> Optional[str]:
+    """
+    Strong ETag for a stored file; Telegram's unique ID never changes for the same bytes.
+
+    `variant` tells apart other byte layouts served for the same file.
+    """
+    unique_id = file_data.get('telegramFileUniqueId')
+    if not unique_id:
+        return None
+    return f'"{unique_id}-{variant}"' if variant else f'"{unique_id}"'
+
+def _etag_list(header_value: str):
+    return [tag.strip() for tag in header_value.split(',') if tag.strip()]
+
+def not_modified(request: Request, etag: Optional[str]) -> bool:
+    """True when If-None-Match already names this representation (weak comparison)"""
+    header_value = request.headers.get('if-none-match')
+    if not header_value or not etag:
+        return False
+    tags = _etag_list(header_value)
+    return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+def range_applies(request: Request, etag: Optional[str]) -> bool:
+    """
+    Whether the Range header should be honoured.
+
+    If-Range must strongly match the current ETag; a date or stale tag means
+    the client's partial copy may be wrong, so the full file is sent instead.
+    """
+    header_value = request.headers.get('if-range')
+    if not header_value:
+        return True
+    return etag is not None and header_value.strip() == etag
@@ -0,0 +1,176 @@
+# ==================== api/streaming/faststart.py ====================
+import asyncio
+import struct
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from config import config
+from api.streaming.buffers import view
+from api.streaming.mp4 import Mp4Error, find, read_table, scan_top_level
+from api.streaming.planner import CHUNK_SIZE
+from api.streaming.readahead import FetchPart
+from api.streaming.ranges import read_bytes
+
+MP4_TYPES = {'video/mp4', 'video/quicktime', 'video/x-m4v', 'audio/mp4'}
+MP4_EXTENSIONS = ('.mp4', '.m4v', '.mov', '.m4a')
+MAX_ENTRIES = 4096
+
+def is_mp4(file_data: dict) -> bool:
+    name = (file_data.get('fileName') or '').lower()
+    return file_data.get('mimeType') in MP4_TYPES or name.endswith(MP4_EXTENSIONS)
+
+
+class FaststartLayout(NamedTuple):
+    """
+    An MP4 with its trailing moov moved in front of the first mdat.
+
+    Virtual bytes map onto the original file as:
+        [0, insert_at)                    -> same offsets
+        [insert_at, insert_at + len(moov)) -> the patched moov
+        [insert_at + len(moov), moov_end) -> original [insert_at, moov_start)
+        [moov_end, size)                  -> same offsets
+    """
+    insert_at: int
+    moov_start: int
+    moov: bytes  # with every stco/co64 entry shifted by len(moov)
+
+    @property
+    def moov_end(self) -> int:
+        return self.moov_start + len(self.moov)
+
+
+def patch_chunk_offsets(moov: bytes, insert_at: int, moov_start: int) -> bytes:
+    """Shift chunk offsets that point into the moved region by the moov's size"""
+    patched = bytearray(moov)
+    shift = len(moov)
+    for path, fields, limit in (
+        ([b'trak', b'mdia', b'minf', b'stbl', b'stco'], 'I', 0xFFFFFFFF),
+        ([b'trak', b'mdia', b'minf', b'stbl', b'co64'], 'Q', 0xFFFFFFFFFFFFFFFF),
+    ):
+        for box in find(patched, [b'moov'] + path):
+            count, offsets = read_table(patched, box, fields)
+            shifted = [o + shift if insert_at <= o < moov_start else o for o in offsets]
+            if shifted and max(shifted) > limit:
+                # Growing stco into co64 would change the moov size again
+                raise Mp4Error("chunk offsets overflow 32 bits once moved")
+            struct.pack_into(f'>{count}{fields}', patched, box.body + 8, *shifted)
+    return bytes(patched)
+
+
+async def build_layout(fetch: FetchPart, file_size: int) -> Optional[FaststartLayout]:
+    """Work out the faststart layout, or None when moov already comes first"""
+    boxes = await scan_top_level(fetch, file_size)
+    moov = next((box for box in boxes if box.type == b'moov'), None)
+    mdat = next((box for box in boxes if box.type == b'mdat'), None)
+    if moov is None:
+        raise Mp4Error("no moov box")
+    if mdat is None or moov.start < mdat.start:
+        return None
+
+    data = await read_bytes(fetch, moov.start, moov.end - 1, config.STREAM_READAHEAD)
+    if len(data) != moov.size:
+        raise Mp4Error("short read of moov")
+    return FaststartLayout(mdat.start, moov.start, patch_chunk_offsets(data, mdat.start, moov.start))
+
+
+def virtual_fetch(fetch: FetchPart, layout: FaststartLayout, file_size: int) -> FetchPart:
+    """Part fetcher over the faststart byte layout, built from the original parts"""
+    shift = len(layout.moov)
+    header_end = layout.insert_at + shift
+
+    def pieces(first: int, end: int):
+        """(virtual start, virtual end, original offset or None for the moov)"""
+        for start, stop, source in (
+            (0, layout.insert_at, 0),
+            (layout.insert_at, header_end, None),
+            (header_end, layout.moov_end, layout.insert_at - header_end),
+            (layout.moov_end, file_size, 0),
+        ):
+            lo, hi = max(first, start), min(end, stop)
+            if lo < hi:
+                yield lo, hi, None if source is None else lo + source
+
+    async def fetch_part(offset: int, limit: int):
+        spans = list(pieces(offset, min(offset + limit, file_size)))
+        if len(spans) == 1 and spans[0][2] == offset:
+            # Untouched region at its original offset: pass the part through
+            return await fetch(offset, limit)
+
+        # The moved region is read as whole aligned parts, all at once, so it
+        # is cached and coalesced like any other read of the file
+        blocks = sorted({
+            block
+            for lo, hi, source in spans if source is not None
+            for block in range(source - source % CHUNK_SIZE, source + hi - lo, CHUNK_SIZE)
+        })
+        data = dict(zip(blocks, await asyncio.gather(*(fetch(block, CHUNK_SIZE) for block in blocks))))
+
+        out = []
+        for lo, hi, source in spans:
+            if source is None:
+                out.append(view(layout.moov, lo - layout.insert_at, hi - layout.insert_at))
+                continue
+            end = source + hi - lo
+            for block in range(source - source % CHUNK_SIZE, end, CHUNK_SIZE):
+                out.append(view(data[block], max(source, block) - block, min(end, block + CHUNK_SIZE) - block))
+        # Only a part straddling two original parts (or the moov) is copied
+        return out[0] if len(out) == 1 else b"".join(out)
+
+    return fetch_part
+
+
+class FaststartIndex:
+    """
+    Faststart layouts per file, built once and kept in an LRU by moov size.
+
+    Files that can't be rearranged (moov already first, unparseable, offsets
+    that would overflow) are remembered as None so they are only looked at
+    once and then served as they are.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._layouts: "OrderedDict[str, Optional[FaststartLayout]]" = OrderedDict()
+        self._building = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    async def get(self, unique_id: str, fetch: FetchPart, file_size: int) -> Optional[FaststartLayout]:
+        if unique_id in self._layouts:
+            self._layouts.move_to_end(unique_id)
+            return self._layouts[unique_id]
+
+        task = self._building.get(unique_id)
+        if task is None:
+            task = asyncio.ensure_future(self._build(unique_id, fetch, file_size))
+            self._building[unique_id] = task
+            task.add_done_callback(lambda _: self._building.pop(unique_id, None))
+        return await asyncio.shield(task)
+
+    async def _build(self, unique_id: str, fetch: FetchPart, file_size: int):
+        try:
+            layout = await build_layout(fetch, file_size)
+        except Mp4Error as e:
+            print(f"[FASTSTART] Serving {unique_id} as stored: {e}")
+            layout = None
+        # Transport errors propagate and are retried on the next request
+
+        if layout is not None:
+            print(f"[FASTSTART] Moved {len(layout.moov) / 1024:.1f}KB moov to the front of {unique_id}")
+        self._remember(unique_id, layout)
+        return layout
+
+    def _remember(self, unique_id: str, layout: Optional[FaststartLayout]):
+        self._layouts[unique_id] = layout
+        self.total_bytes += len(layout.moov) if layout else 0
+        while len(self._layouts) > 1 and (
+            self.total_bytes > self.max_bytes or len(self._layouts) > MAX_ENTRIES
+        ):
+            _, dropped = self._layouts.popitem(last=False)
+            self.total_bytes -= len(dropped.moov) if dropped else 0
+
+
+faststart = FaststartIndex(config.FASTSTART_CACHE_MB * 1024 * 1024)
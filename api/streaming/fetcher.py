@@ -0,0 +1,138 @@
+# ==================== api/streaming/fetcher.py ====================
+import asyncio
+
+from pyrogram import raw
+from pyrogram.errors import FileReferenceExpired, FileReferenceInvalid, FloodWait
+from pyrogram.errors.exceptions.see_other_303 import FileMigrate
+
+from config import config
+from bot.workers import get_streaming_client, resolve_file_id
+from api.streaming.buffers import allocations
+from api.streaming.cache import cached_fetch
+from api.streaming.hedging import hedged_invoke
+from api.streaming.hotstart import hot_fetch
+from api.streaming.locations import resolver
+from api.streaming.planner import CHUNK_SIZE
+from api.streaming.readahead import FetchPart
+from api.streaming.resilience import RETRYABLE_ERRORS, backoff_delay, get_breaker
+from api.streaming.scheduler import Flow, Priority, client_slots, get_scheduler
+from api.streaming.sessions import get_session_pool
+from api.streaming.singleflight import coalesced_fetch
+
+MAX_MIGRATIONS = 2
+
+class TelegramSource:
+    """
+    Reads parts of one stored file through a client's media sessions.
+
+    Each part is requested at its exact offset, so every recovery below
+    resumes precisely where the response left off:
+
+    - network errors and timeouts are retried with backoff on a different
+      session of the pool (a fresh one is opened if none is left);
+    - FILE_MIGRATE_X switches to the pool of the DC Telegram points at;
+    - an expired file_reference is refreshed from the channel copy;
+    - a request slower than the DC's recent latency percentile is hedged
+      onto a second session;
+    - FloodWait pauses the DC in the scheduler for everyone, then the part
+      is queued again.
+
+    Every attempt first waits its turn in the account's per-DC scheduler, and
+    each client IP only has a capped number of parts in flight.
+
+    A per-DC circuit breaker stops piling requests onto a DC that keeps failing.
+    """
+
+    def __init__(self, client, file_data: dict, telegram_file_id: str, flow: Flow = Flow()):
+        self.client = client
+        self.file_data = file_data
+        self.telegram_file_id = telegram_file_id
+        self.flow = flow
+        self.dc_id = None  # set after FILE_MIGRATE_X
+
+    async def fetch(self, offset: int, limit: int) -> bytes:
+        async with client_slots.slot(self.flow.client):
+            return await self._fetch(offset, limit)
+
+    async def _fetch(self, offset: int, limit: int) -> bytes:
+        refreshed = False
+        migrations = 0
+        attempt = 0
+        failed = []
+
+        while True:
+            resolved = resolver.resolve(self.telegram_file_id)
+            dc_id = self.dc_id or resolved.file_id.dc_id
+            breaker = get_breaker(dc_id)
+            breaker.check()
+
+            scheduler = get_scheduler(self.client, dc_id)
+            pool = await get_session_pool(self.client, dc_id)
+            pooled = None
+            try:
+                # The slot covers only the request itself, not the recovery below
+                async with scheduler.slot(self.flow):
+                    pooled = await pool.acquire(exclude=failed)
+                    r = await hedged_invoke(
+                        pool, pooled, scheduler,
+                        raw.functions.upload.GetFile(
+                            location=resolved.location,
+                            offset=offset,
+                            limit=limit,
+                            precise=limit != CHUNK_SIZE or None
+                        ),
+                        # Failover below retries on another connection; pyrogram's own retry
+                        # would repeat on this one and sleep FloodWaits without sleep_threshold
+                        retries=0,
+                        timeout=config.STREAM_FETCH_TIMEOUT,
+                        sleep_threshold=0
+                    )
+            except FloodWait as e:
+                # Pause the whole DC for this account, then queue again
+                if e.value > config.STREAM_MAX_FLOOD_WAIT:
+                    raise
+                scheduler.flood_wait(e.value)
+                continue
+            except (FileReferenceExpired, FileReferenceInvalid):
+                if refreshed or not self.file_data.get('channelMessageId'):
+                    raise
+                refreshed = True
+                resolver.forget(self.telegram_file_id)
+                self.telegram_file_id = await resolve_file_id(self.client, self.file_data, refresh=True)
+                print(f"[FETCH] Refreshed file reference for {self.file_data.get('_id')}")
+                continue
+            except FileMigrate as e:
+                migrations += 1
+                if migrations > MAX_MIGRATIONS:
+                    raise
+                print(f"[FETCH] File {self.file_data.get('_id')} migrated from DC {dc_id} to DC {e.value}")
+                self.dc_id = e.value
+                failed = []
+                continue
+            except RETRYABLE_ERRORS as e:
+                breaker.record_failure()
+                attempt += 1
+                if attempt > config.STREAM_FETCH_RETRIES:
+                    raise
+                print(f"[FETCH] DC {dc_id} offset {offset} failed ({e!r}), retry {attempt}")
+                if pooled is not None:
+                    failed.append(pooled)
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+
+            breaker.record_success()
+            if isinstance(r, raw.types.upload.File):
+                allocations.record_allocation(len(r.bytes))
+                return r.bytes
+            return b""
+
+
+async def open_fetcher(file_data: dict, priority: Priority = Priority.PLAYBACK, client_ip: str = "") -> FetchPart:
+    """Build the part fetcher for a file: hot-start store, chunk cache, coalescing, then Telegram"""
+    client, telegram_file_id = await get_streaming_client(file_data)
+    resolver.touch(file_data)
+
+    flow = Flow(priority, client_ip, file_data.get('telegramFileUniqueId') or str(file_data.get('_id')))
+    source = TelegramSource(client, file_data, telegram_file_id, flow)
+    unique_id = file_data.get('telegramFileUniqueId')
+    return hot_fetch(cached_fetch(coalesced_fetch(source.fetch, unique_id), unique_id), unique_id)
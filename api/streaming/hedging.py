@@ -0,0 +1,121 @@
+# ==================== api/streaming/hedging.py ====================
+import asyncio
+import time
+from collections import deque
+
+from config import config
+
+LATENCY_SAMPLES = 200  # recent GetFile latencies kept per DC
+MIN_SAMPLES = 20  # no hedging until the percentile means something
+MIN_HEDGE_DELAY = 0.05
+BUDGET_BURST = 10  # hedges that may be spent back to back
+
+class LatencyTracker:
+    """Rolling window of GetFile latencies per DC"""
+
+    def __init__(self):
+        self._samples = {}
+
+    def record(self, dc_id: int, seconds: float):
+        samples = self._samples.get(dc_id)
+        if samples is None:
+            samples = self._samples[dc_id] = deque(maxlen=LATENCY_SAMPLES)
+        samples.append(seconds)
+
+    def percentile(self, dc_id: int, pct: float):
+        samples = self._samples.get(dc_id)
+        if not samples or len(samples) < MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+        return ordered[index]
+
+
+class HedgeBudget:
+    """
+    Token bucket bounding hedges to a fraction of primary requests.
+
+    Every primary request earns `ratio` tokens and every hedge spends one,
+    so hedges stay under `ratio` of total load over time.
+    """
+
+    def __init__(self, ratio: float):
+        self.ratio = ratio
+        self.tokens = 0.0
+        self.primaries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def earn(self):
+        self.primaries += 1
+        self.tokens = min(self.tokens + self.ratio, BUDGET_BURST)
+
+    def can_spend(self) -> bool:
+        return self.tokens >= 1
+
+    def spend(self):
+        self.tokens -= 1
+        self.hedges += 1
+
+
+latencies = LatencyTracker()
+budget = HedgeBudget(config.STREAM_HEDGE_BUDGET / 100)
+
+
+async def _timed(call, dc_id: int):
+    started = time.monotonic()
+    result = await call()
+    latencies.record(dc_id, time.monotonic() - started)
+    return result
+
+
+async def hedged_invoke(pool, pooled, scheduler, query, **kwargs):
+    """
+    Invoke `query` on `pooled`, hedging onto a second session when it is slow.
+
+    If no answer arrives within the configured latency percentile for the DC,
+    the same request is sent on another live session of `pool` and whichever
+    answers first wins; the other is cancelled. Hedges are skipped when the
+    budget is spent, the DC scheduler has no free slot, or there is no
+    second session to use.
+    """
+    dc_id = pool.dc_id
+    hedged = False
+    budget.earn()
+    primary = asyncio.ensure_future(_timed(lambda: pooled.invoke(query, **kwargs), dc_id))
+    racers = [primary]
+
+    try:
+        delay = None
+        if config.STREAM_HEDGE_PERCENTILE:
+            delay = latencies.percentile(dc_id, config.STREAM_HEDGE_PERCENTILE)
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait(racers, timeout=max(delay, MIN_HEDGE_DELAY))
+        others = [s for s in pool.sessions if s is not pooled and s.alive]
+        # The budget is only spent once the scheduler has let the hedge through
+        if done or not others or not budget.can_spend() or not scheduler.try_acquire():
+            return await primary
+        budget.spend()
+        hedged = True
+
+        other = min(others, key=lambda s: s.outstanding)
+        hedge = asyncio.ensure_future(_timed(lambda: other.invoke(query, **kwargs), dc_id))
+        racers.append(hedge)
+
+        pending, error = set(racers), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        budget.hedge_wins += 1
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in racers:
+            task.cancel()
+        if hedged:
+            scheduler.release()
@@ -0,0 +1,357 @@
+# ==================== api/streaming/hls.py ====================
+import asyncio
+import math
+import re
+import secrets
+import shutil
+import struct
+from contextlib import aclosing
+from typing import Dict, List, NamedTuple, Tuple
+
+from config import config
+from api.streaming.buffers import Chunk
+from api.streaming.cache import ChunkCache
+from api.streaming.mp4 import Mp4Error, find, full_box, iter_boxes, media_header
+from api.streaming.ranges import stream_bytes
+from api.streaming.readahead import FetchPart
+from api.streaming.seekindex import SeekIndex
+
+INIT = 0  # store key of the init segment; media segments are numbered from 1
+REMUX_TIMEOUT = 120  # seconds for one ffmpeg run, input included
+# Per-process key on ffmpeg's loopback source URL, so /source serves nobody else
+SOURCE_KEY = secrets.token_urlsafe(24)
+
+# Remuxed segments, evicted by the same LRU as Telegram parts
+segment_store = ChunkCache(config.HLS_CACHE_DIR, config.HLS_CACHE_MAX_MB * 1024 * 1024)
+
+class RemuxError(Exception):
+    """ffmpeg failed or produced something that isn't fragmented MP4"""
+
+
+class Segment(NamedTuple):
+    number: int
+    start: float  # seconds
+    duration: float
+    first: int  # offset of the Cluster the segment starts with
+    end: int  # exclusive
+
+
+def plan_segments(index: SeekIndex, file_size: int, target: float) -> List[Segment]:
+    """Cut the file at the first keyframe at least `target` seconds after the last cut"""
+    if not index.times:
+        return []
+    # Media ends where a trailing index (MKV Cues, MP4 moov) begins
+    trailer = index.header_ranges[-1][0] if len(index.header_ranges) > 1 else file_size
+    media_end = trailer if trailer > index.offsets[-1] else file_size
+
+    cuts = [0]
+    for i, seconds in enumerate(index.times):
+        if seconds - index.times[cuts[-1]] >= target:
+            cuts.append(i)
+
+    duration = max(index.duration or 0, index.times[-1])
+    segments = []
+    for n, i in enumerate(cuts):
+        following = cuts[n + 1] if n + 1 < len(cuts) else None
+        stop = index.times[following] if following is not None else duration
+        end = index.offsets[following] if following is not None else media_end
+        segments.append(Segment(n + 1, index.times[i], stop - index.times[i], index.offsets[i], end))
+    return segments
+
+
+def media_playlist(segments: List[Segment]) -> str:
+    target = max((math.ceil(s.duration) for s in segments), default=config.HLS_SEGMENT_SECONDS)
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:7',
+        f'#EXT-X-TARGETDURATION:{target}',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+        '#EXT-X-INDEPENDENT-SEGMENTS',
+        '#EXT-X-MAP:URI="init.mp4"',
+    ]
+    for segment in segments:
+        lines.append(f'#EXTINF:{segment.duration:.3f},')
+        lines.append(f'{segment.number}.m4s')
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
+
+
+QUALITY_HEIGHT = re.compile(r'(\d{3,4})p', re.IGNORECASE)
+
+def variant_height(quality: str) -> int:
+    """Frame height from a quality label like 1080p or 4K, 0 if unknown"""
+    quality = quality or ''
+    if '4k' in quality.lower():
+        return 2160
+    match = QUALITY_HEIGHT.search(quality)
+    return int(match.group(1)) if match else 0
+
+
+def master_playlist(variants: List[Tuple[dict, SeekIndex]]) -> str:
+    """
+    Multi-variant playlist over each file's own media playlist, best first.
+
+    Bandwidth is the file's average bitrate; the peak is estimated with
+    some headroom since it would take a full scan to measure.
+    """
+    entries = []
+    for file_data, index in variants:
+        duration = index.duration or file_data.get('duration') or 0
+        if duration <= 0:
+            continue
+        average = int(file_data.get('size', 0) * 8 / duration)
+        height = variant_height(file_data.get('quality'))
+        attributes = [f'BANDWIDTH={int(average * 1.25)}', f'AVERAGE-BANDWIDTH={average}']
+        if height:
+            attributes.append(f'RESOLUTION={round(height * 16 / 9 / 2) * 2}x{height}')
+        attributes.append(f'NAME="{file_data.get("quality") or "Unknown"}"')
+        entries.append((height, average, attributes, str(file_data['_id'])))
+
+    lines = ['#EXTM3U', '#EXT-X-VERSION:7', '#EXT-X-INDEPENDENT-SEGMENTS']
+    for _, _, attributes, file_id in sorted(entries, key=lambda e: (e[0], e[1]), reverse=True):
+        lines.append('#EXT-X-STREAM-INF:' + ','.join(attributes))
+        lines.append(f'{config.BASE_APP_URL}/hls/{file_id}/index.m3u8')
+    return '\n'.join(lines) + '\n'
+
+
+def source_url(file_id: str) -> str:
+    """Where ffmpeg reads a file over HTTP, through this server's own range handling"""
+    return f'http://127.0.0.1:{config.PORT}/hls/{file_id}/source?key={SOURCE_KEY}'
+
+
+def is_source_request(host: str, key: str) -> bool:
+    """Whether a /source read comes from our own ffmpeg"""
+    return host in ('127.0.0.1', '::1') and secrets.compare_digest(key or '', SOURCE_KEY)
+
+
+def ffmpeg_args(input_args: List[str]) -> List[str]:
+    return [
+        config.FFMPEG_PATH, '-hide_banner', '-loglevel', 'error',
+        # Every run starts at 0; split_fmp4 moves the segment to its place in the timeline
+        *input_args,
+        '-map', '0:v:0', '-map', '0:a:0?', '-sn', '-dn',
+        '-c:v', 'copy', '-c:a', config.HLS_AUDIO_CODEC,
+        '-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+        '-muxdelay', '0', 'pipe:1',
+    ]
+
+
+def track_timescales(init) -> Dict[int, int]:
+    """Track ID -> mdhd timescale of every track in an init segment"""
+    timescales = {}
+    for trak in find(init, [b'moov', b'trak']):
+        tkhd = find(init, [b'tkhd'], trak.body, trak.end)
+        mdhd = find(init, [b'mdia', b'mdhd'], trak.body, trak.end)
+        if tkhd and mdhd:
+            version, _, pos = full_box(init, tkhd[0])
+            # creation and modification times come first, 64-bit in version 1
+            track_id = struct.unpack_from('>I', init, pos + (16 if version == 1 else 8))[0]
+            timescales[track_id] = media_header(init, mdhd[0])[0]
+    return timescales
+
+
+def retime(init, media, start: float) -> bytes:
+    """
+    Rewrite every traf's tfdt so the media segment starts `start` seconds
+    into the file. Fragments within the run keep their spacing.
+    """
+    timescales = track_timescales(init)
+    patched = bytearray(media)
+    first = {}
+    for traf in find(patched, [b'moof', b'traf']):
+        tfhd = find(patched, [b'tfhd'], traf.body, traf.end)
+        tfdt = find(patched, [b'tfdt'], traf.body, traf.end)
+        if not tfhd or not tfdt:
+            raise RemuxError("fragment without tfhd or tfdt")
+        track_id = struct.unpack_from('>I', patched, full_box(patched, tfhd[0])[2])[0]
+        if track_id not in timescales:
+            raise RemuxError(f"fragment of unknown track {track_id}")
+
+        version, _, pos = full_box(patched, tfdt[0])
+        layout = '>Q' if version == 1 else '>I'
+        decode_time = struct.unpack_from(layout, patched, pos)[0]
+        offset = decode_time - first.setdefault(track_id, decode_time)
+        decode_time = round(start * timescales[track_id]) + offset
+        if version == 0 and decode_time > 0xFFFFFFFF:
+            raise RemuxError("decode time overflows a version 0 tfdt")
+        struct.pack_into(layout, patched, pos, decode_time)
+    return bytes(patched)
+
+
+def split_fmp4(data: bytes, start: float) -> Tuple[bytes, bytes]:
+    """(init segment, media segment starting at `start` seconds) of a fragmented MP4"""
+    init, media = [], []
+    try:
+        for box in iter_boxes(data):
+            if box.type in (b'ftyp', b'moov'):
+                init.append(data[box.start:box.end])
+            elif box.type in (b'styp', b'moof', b'mdat'):
+                # sidx is left out: its times would be as stale as the tfdt's
+                media.append(data[box.start:box.end])
+        if not init or not media:
+            raise RemuxError("ffmpeg output has no init or no fragments")
+        init = b"".join(init)
+        return init, retime(init, b"".join(media), start)
+    except Mp4Error as e:
+        raise RemuxError(f"unreadable ffmpeg output: {e}")
+
+
+async def run_ffmpeg(args: List[str], feed=None) -> bytes:
+    """Run ffmpeg to completion, writing `feed` (chunks) to its stdin if given"""
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.PIPE if feed else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    async def write():
+        try:
+            async with aclosing(feed) as chunks:
+                async for chunk in chunks:
+                    proc.stdin.write(chunk)
+                    await proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # ffmpeg exited early; its stderr says why
+        finally:
+            proc.stdin.close()
+
+    feeder = asyncio.ensure_future(write()) if feed else None
+    try:
+        out, err = await asyncio.wait_for(
+            asyncio.gather(proc.stdout.read(), proc.stderr.read()), REMUX_TIMEOUT
+        )
+        # A failed read must not leave a truncated segment behind
+        if feeder:
+            await feeder
+        await proc.wait()
+    except BaseException:
+        if feeder:
+            feeder.cancel()
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+
+    if proc.returncode != 0:
+        raise RemuxError(err.decode(errors='replace').strip()[-300:] or f"ffmpeg exited {proc.returncode}")
+    return out
+
+
+async def remux(fetch: FetchPart, head_end: int, segment: Segment, window: int) -> bytes:
+    """
+    Run one MKV segment through ffmpeg: the Matroska head, then the
+    segment's Clusters, piped in from ranged reads as they arrive.
+    """
+    async def chunks():
+        for first, last in ((0, head_end - 1), (segment.first, segment.end - 1)):
+            async with aclosing(stream_bytes(fetch, first, last, window)) as body:
+                async for chunk in body:
+                    yield chunk
+
+    return await run_ffmpeg(ffmpeg_args(['-i', 'pipe:0']), chunks())
+
+
+async def remux_url(url: str, segment: Segment) -> bytes:
+    """
+    Run one MP4 segment through ffmpeg reading `url`. Its sample data is
+    interleaved and addressed through moov, so ffmpeg seeks by itself with
+    range requests instead of being fed one byte span. Both -ss and -t are
+    input options, so the window is cut on the file's own timeline.
+    """
+    return await run_ffmpeg(ffmpeg_args([
+        '-ss', f'{segment.start:.3f}', '-t', f'{segment.duration:.3f}', '-i', url,
+    ]))
+
+
+class HlsRemuxer:
+    """
+    MKV and MP4 to fragmented-MP4 HLS, one keyframe-aligned segment per
+    ffmpeg run.
+
+    Runs are limited to HLS_WORKERS at once, shared by viewers and read-ahead,
+    and each segment is remuxed once: concurrent requests join the run in
+    flight and later ones are served from the segment store.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._slots = asyncio.Semaphore(max(workers, 1))
+        self._building = {}
+        self._ahead = set()
+        self._ffmpeg = None
+
+    @property
+    def available(self) -> bool:
+        if self.workers <= 0:
+            return False
+        if self._ffmpeg is None:
+            self._ffmpeg = shutil.which(config.FFMPEG_PATH) is not None
+            if not self._ffmpeg:
+                print(f"[HLS] {config.FFMPEG_PATH} not found, HLS is disabled")
+        return self._ffmpeg
+
+    async def init_segment(self, file_data: dict, fetch: FetchPart, index: SeekIndex, segments: List[Segment]) -> Chunk:
+        hit = segment_store.get(file_data['telegramFileUniqueId'], INIT)
+        if hit is not None:
+            return hit
+        # ffmpeg writes the init segment with every run; take it from the first
+        init, _ = await self._build_once(file_data, fetch, index, segments[0])
+        return init
+
+    async def segment(self, file_data: dict, fetch: FetchPart, index: SeekIndex, segment: Segment) -> Chunk:
+        hit = segment_store.get(file_data['telegramFileUniqueId'], segment.number)
+        if hit is not None:
+            return hit
+        _, media = await self._build_once(file_data, fetch, index, segment)
+        return media
+
+    def ahead(self, file_data: dict, fetch: FetchPart, index: SeekIndex, segments: List[Segment], number: int):
+        """Remux the segments after `number` in the background"""
+        if not segment_store.enabled:
+            return
+        for segment in segments[number:number + config.HLS_AHEAD_SEGMENTS]:
+            key = (file_data['telegramFileUniqueId'], segment.number)
+            if segment_store.contains(*key) or key in self._building:
+                continue
+            task = asyncio.ensure_future(self._build_once(file_data, fetch, index, segment))
+            self._ahead.add(task)
+            task.add_done_callback(self._finish_ahead)
+
+    def _finish_ahead(self, task: asyncio.Task):
+        self._ahead.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"[HLS] Read-ahead remux failed: {task.exception()}")
+
+    async def _build_once(self, file_data: dict, fetch: FetchPart, index: SeekIndex, segment: Segment):
+        key = (file_data['telegramFileUniqueId'], segment.number)
+        task = self._building.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._build(file_data, fetch, index, segment))
+            self._building[key] = task
+            task.add_done_callback(lambda _: self._building.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _build(self, file_data: dict, fetch: FetchPart, index: SeekIndex, segment: Segment):
+        unique_id = file_data['telegramFileUniqueId']
+        async with self._slots:
+            if index.container == 'mkv':
+                head_end = index.header_ranges[0][1] + 1
+                out = await remux(fetch, head_end, segment, config.STREAM_READAHEAD)
+            else:
+                out = await remux_url(source_url(str(file_data['_id'])), segment)
+        init, media = split_fmp4(out, segment.start)
+        await segment_store.put(unique_id, INIT, init)
+        await segment_store.put(unique_id, segment.number, media)
+        return init, media
+
+    def stats(self) -> dict:
+        return {
+            'available': self.available,
+            'workers': self.workers,
+            'building': len(self._building),
+            'cache': segment_store.stats(),
+        }
+
+
+remuxer = HlsRemuxer(config.HLS_WORKERS)
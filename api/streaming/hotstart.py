@@ -0,0 +1,72 @@
+# ==================== api/streaming/hotstart.py ====================
+import asyncio
+
+from config import config
+from api.streaming.cache import ChunkCache, cached_fetch
+from api.streaming.planner import CHUNK_SIZE
+from api.streaming.readahead import FetchPart
+from api.streaming.scheduler import Priority
+
+# Head and tail of every upload, captured at ingest. Kept apart from the
+# chunk cache so viewing traffic never evicts a file's first seconds.
+hot_store = ChunkCache(config.HOT_START_DIR, config.HOT_START_MAX_MB * 1024 * 1024)
+
+_queue = None
+_worker = None
+
+def hot_offsets(file_size: int, head_mb: int) -> list:
+    """1MB-aligned parts a player reads first: the head, then the last part"""
+    if file_size <= 0 or head_mb <= 0:
+        return []
+    head = min(head_mb, -(-file_size // CHUNK_SIZE))
+    offsets = [i * CHUNK_SIZE for i in range(head)]
+    tail = (file_size - 1) // CHUNK_SIZE * CHUNK_SIZE
+    if tail not in offsets:
+        offsets.append(tail)
+    return offsets
+
+
+def hot_fetch(fetch: FetchPart, unique_id: str) -> FetchPart:
+    """Serve parts captured at ingest before asking `fetch`"""
+    return cached_fetch(fetch, unique_id, hot_store, fill=False)
+
+
+def queue_hot_start(file_data: dict):
+    """Capture the head and tail of a new upload in the background"""
+    global _queue, _worker
+    if not hot_store.enabled or not file_data.get('telegramFileUniqueId'):
+        return
+    if _queue is None:
+        _queue = asyncio.Queue()
+    _queue.put_nowait(file_data)
+    if _worker is None or _worker.done():
+        _worker = asyncio.ensure_future(_capture_loop())
+
+
+async def _capture_loop():
+    # One file at a time: a bulk upload shouldn't compete with viewers
+    while True:
+        file_data = await _queue.get()
+        try:
+            await capture(file_data)
+        except Exception as e:
+            print(f"[HOTSTART] Failed to capture {file_data.get('_id')}: {e}")
+
+
+async def capture(file_data: dict):
+    # Imported here: open_fetcher itself reads through hot_fetch
+    from api.streaming.fetcher import open_fetcher
+
+    unique_id = file_data['telegramFileUniqueId']
+    offsets = [
+        offset for offset in hot_offsets(file_data.get('size', 0), config.HOT_START_HEAD_MB)
+        if not hot_store.contains(unique_id, offset)
+    ]
+    if not offsets:
+        return
+
+    fetch_part = await open_fetcher(file_data, Priority.BACKGROUND)
+    parts = await asyncio.gather(*(fetch_part(offset, CHUNK_SIZE) for offset in offsets))
+    for offset, data in zip(offsets, parts):
+        await hot_store.put(unique_id, offset, data)
+    print(f"[HOTSTART] Captured {len(offsets)} parts of {file_data.get('fileName', unique_id)}")
@@ -0,0 +1,123 @@
+# ==================== api/streaming/locations.py ====================
+import asyncio
+from collections import OrderedDict
+from typing import NamedTuple
+
+from pyrogram import raw
+from pyrogram import utils as pyro_utils
+from pyrogram.file_id import FileId, FileType, ThumbnailSource
+
+from config import config
+
+REFRESH_BATCH_SIZE = 200  # messages per get_messages call
+
+class ResolvedFile(NamedTuple):
+    file_id: FileId
+    location: object
+
+def build_location(file_id: FileId):
+    """Get file location for raw API"""
+    file_type = file_id.file_type
+
+    if file_type == FileType.CHAT_PHOTO:
+        if file_id.chat_id > 0:
+            peer = raw.types.InputPeerUser(
+                user_id=file_id.chat_id,
+                access_hash=file_id.chat_access_hash
+            )
+        else:
+            if file_id.chat_access_hash == 0:
+                peer = raw.types.InputPeerChat(chat_id=-file_id.chat_id)
+            else:
+                peer = raw.types.InputPeerChannel(
+                    channel_id=pyro_utils.get_channel_id(file_id.chat_id),
+                    access_hash=file_id.chat_access_hash
+                )
+
+        return raw.types.InputPeerPhotoFileLocation(
+            peer=peer,
+            volume_id=file_id.volume_id,
+            local_id=file_id.local_id,
+            big=file_id.thumbnail_source == ThumbnailSource.CHAT_PHOTO_BIG
+        )
+    elif file_type == FileType.PHOTO:
+        return raw.types.InputPhotoFileLocation(
+            id=file_id.media_id,
+            access_hash=file_id.access_hash,
+            file_reference=file_id.file_reference,
+            thumb_size=file_id.thumbnail_size
+        )
+    return raw.types.InputDocumentFileLocation(
+        id=file_id.media_id,
+        access_hash=file_id.access_hash,
+        file_reference=file_id.file_reference,
+        thumb_size=file_id.thumbnail_size
+    )
+
+
+class LocationResolver:
+    """
+    LRU cache of decoded file IDs and their raw locations.
+
+    Also remembers which files were streamed recently so their file
+    references can be refreshed in bulk before Telegram expires them.
+    """
+
+    def __init__(self, max_entries: int, hot_files: int):
+        self.max_entries = max_entries
+        self.hot_files = hot_files
+        self._resolved: "OrderedDict[str, ResolvedFile]" = OrderedDict()
+        self._hot: "OrderedDict[str, dict]" = OrderedDict()
+        self._refresh_task = None
+
+    def resolve(self, telegram_file_id: str) -> ResolvedFile:
+        resolved = self._resolved.get(telegram_file_id)
+        if resolved is not None:
+            self._resolved.move_to_end(telegram_file_id)
+            return resolved
+
+        file_id = FileId.decode(telegram_file_id)
+        resolved = ResolvedFile(file_id, build_location(file_id))
+        self._resolved[telegram_file_id] = resolved
+        if len(self._resolved) > self.max_entries:
+            self._resolved.popitem(last=False)
+        return resolved
+
+    def forget(self, telegram_file_id: str):
+        self._resolved.pop(telegram_file_id, None)
+
+    def touch(self, file_data: dict):
+        """Record a streamed file as hot for the background refresh"""
+        if not file_data.get('channelMessageId'):
+            return
+        key = str(file_data['_id'])
+        self._hot[key] = file_data
+        self._hot.move_to_end(key)
+        if len(self._hot) > self.hot_files:
+            self._hot.popitem(last=False)
+
+        if config.FILE_REFERENCE_REFRESH_INTERVAL > 0 and (
+            self._refresh_task is None or self._refresh_task.done()
+        ):
+            self._refresh_task = asyncio.ensure_future(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(config.FILE_REFERENCE_REFRESH_INTERVAL)
+            try:
+                await self.refresh_hot_files()
+            except Exception as e:
+                print(f"[LOCATIONS] Bulk file reference refresh failed: {e}")
+
+    async def refresh_hot_files(self):
+        """Re-read the channel copies of hot files so their references stay fresh"""
+        from bot.workers import refresh_file_ids
+
+        files = list(self._hot.values())
+        for start in range(0, len(files), REFRESH_BATCH_SIZE):
+            await refresh_file_ids(files[start:start + REFRESH_BATCH_SIZE])
+        if files:
+            print(f"[LOCATIONS] Refreshed file references for {len(files)} hot files")
+
+
+resolver = LocationResolver(config.LOCATION_CACHE_SIZE, config.FILE_REFERENCE_HOT_FILES)
@@ -0,0 +1,226 @@
+# ==================== api/streaming/mkv.py ====================
+import struct
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from api.streaming.readahead import FetchPart
+from api.streaming.ranges import read_bytes
+
+EBML = 0x1A45DFA3
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+TRACK_TYPE = 0x83
+CUES = 0x1C53BB6B
+CUE_POINT = 0xBB
+CUE_TIME = 0xB3
+CUE_TRACK_POSITIONS = 0xB7
+CUE_TRACK = 0xF7
+CUE_CLUSTER_POSITION = 0xF1
+CLUSTER = 0x1F43B675
+
+HEAD_BYTES = 64 * 1024  # EBML header, SeekHead, Info and Tracks normally fit
+MAX_HEADER = 12  # 4-byte ID plus 8-byte size
+MAX_HEAD_ELEMENTS = 256  # top-level elements stepped over looking for the first Cluster
+UNKNOWN_SIZE = -1
+
+class MkvError(ValueError):
+    """The file is not a Matroska/WebM file we can make sense of"""
+
+
+class Element(NamedTuple):
+    id: int
+    start: int  # offset of the element ID
+    header: int  # ID plus size length
+    size: int  # payload size, UNKNOWN_SIZE for live-style streams
+
+    @property
+    def body(self) -> int:
+        return self.start + self.header
+
+    @property
+    def end(self) -> int:
+        return self.body + self.size
+
+
+def _vint(data, pos: int, keep_marker: bool) -> Tuple[int, int]:
+    if pos >= len(data):
+        raise MkvError(f"truncated element at {pos}")
+    first = data[pos]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8 or pos + length > len(data):
+        raise MkvError(f"bad variable-length integer at {pos}")
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    return value, length
+
+
+def read_element(data, pos: int) -> Element:
+    element_id, id_length = _vint(data, pos, keep_marker=True)
+    size, size_length = _vint(data, pos + id_length, keep_marker=False)
+    if size == (1 << (7 * size_length)) - 1:
+        size = UNKNOWN_SIZE
+    return Element(element_id, pos, id_length + size_length, size)
+
+
+def iter_elements(data, start: int, end: int) -> Iterator[Element]:
+    """Elements back to back in `data[start:end]`; stops at a truncated one"""
+    pos = start
+    while pos < end:
+        try:
+            element = read_element(data, pos)
+        except MkvError:
+            return
+        yield element
+        if element.size == UNKNOWN_SIZE:
+            return
+        pos = element.end
+
+
+def read_uint(data, element: Element) -> int:
+    return int.from_bytes(data[element.body:element.end], 'big')
+
+
+def read_float(data, element: Element) -> float:
+    if element.size == 4:
+        return struct.unpack_from('>f', data, element.body)[0]
+    if element.size == 8:
+        return struct.unpack_from('>d', data, element.body)[0]
+    return 0.0
+
+
+def _children(data, element: Element) -> Dict[int, Element]:
+    return {child.id: child for child in iter_elements(data, element.body, min(element.end, len(data)))}
+
+
+class SegmentInfo(NamedTuple):
+    data_start: int  # Segment payload offset; SeekHead and Cues positions are relative to it
+    timecode_scale: int  # nanoseconds per timecode tick
+    duration: Optional[float]  # seconds
+    video_track: Optional[int]
+    cues: Optional[int]  # absolute offset of the Cues element
+    head_end: int  # offset of the first Cluster: everything a demuxer needs comes before it
+
+
+def _read_metadata(data, element: Element, data_start: int, found: dict):
+    """Pick what the index needs out of a top-level SeekHead, Info or Tracks"""
+    if element.id == SEEK_HEAD:
+        for seek in iter_elements(data, element.body, element.end):
+            fields = _children(data, seek)
+            if SEEK_ID in fields and SEEK_POSITION in fields:
+                target = int.from_bytes(data[fields[SEEK_ID].body:fields[SEEK_ID].end], 'big')
+                if target == CUES and found['cues'] is None:
+                    found['cues'] = data_start + read_uint(data, fields[SEEK_POSITION])
+    elif element.id == INFO:
+        fields = _children(data, element)
+        if TIMECODE_SCALE in fields:
+            found['timecode_scale'] = read_uint(data, fields[TIMECODE_SCALE])
+        if DURATION in fields:
+            found['duration'] = read_float(data, fields[DURATION])
+    elif element.id == TRACKS:
+        for entry in iter_elements(data, element.body, element.end):
+            fields = _children(data, entry)
+            if found['video_track'] is None and TRACK_TYPE in fields and read_uint(data, fields[TRACK_TYPE]) == 1:
+                found['video_track'] = read_uint(data, fields[TRACK_NUMBER]) if TRACK_NUMBER in fields else None
+
+
+async def scan_head(fetch: FetchPart, file_size: int) -> SegmentInfo:
+    """
+    Read the Segment's top-level metadata up to the first Cluster.
+
+    Most heads fit in the first HEAD_BYTES; anything past that (attached
+    fonts, chapters, tags) is stepped over by reading element headers only,
+    so `head_end` always lands exactly on the first Cluster.
+    """
+    head = await read_bytes(fetch, 0, min(HEAD_BYTES, file_size) - 1)
+    elements = list(iter_elements(head, 0, len(head)))
+    if not elements or elements[0].id != EBML:
+        raise MkvError("no EBML header")
+    segment = next((e for e in elements if e.id == SEGMENT), None)
+    if segment is None:
+        raise MkvError("no Segment element")
+
+    data_start = segment.body
+    found = {'timecode_scale': 1000000, 'duration': None, 'video_track': None, 'cues': None}
+    pos = data_start
+    for _ in range(MAX_HEAD_ELEMENTS):
+        if pos >= file_size:
+            raise MkvError("no Cluster in the file")
+        if pos + MAX_HEADER <= len(head):
+            element = read_element(head, pos)
+        else:
+            data = await read_bytes(fetch, pos, min(pos + MAX_HEADER, file_size) - 1)
+            element = read_element(data, 0)._replace(start=pos)
+
+        if element.id == CLUSTER:
+            duration = found['duration']
+            return SegmentInfo(
+                data_start,
+                found['timecode_scale'],
+                duration * found['timecode_scale'] / 1e9 if duration is not None else None,
+                found['video_track'],
+                found['cues'],
+                element.start,
+            )
+        if element.size == UNKNOWN_SIZE:
+            raise MkvError("unknown-size element before the first Cluster")
+        if element.id == CUES:
+            found['cues'] = element.start
+        elif element.id in (SEEK_HEAD, INFO, TRACKS):
+            if element.end <= len(head):
+                _read_metadata(head, element, data_start, found)
+            else:
+                data = await read_bytes(fetch, element.start, min(element.end, file_size) - 1)
+                _read_metadata(data, element._replace(start=0), data_start, found)
+        pos = element.end
+    raise MkvError(f"no Cluster within the first {MAX_HEAD_ELEMENTS} elements")
+
+
+def parse_cues(data, info: SegmentInfo) -> Tuple[List[float], List[int]]:
+    """Keyframe times (seconds) and absolute Cluster offsets from a Cues element"""
+    cues = read_element(data, 0)
+    if cues.id != CUES:
+        raise MkvError("Cues position does not point at a Cues element")
+
+    times, offsets = [], []
+    for point in iter_elements(data, cues.body, min(cues.end, len(data))):
+        if point.id != CUE_POINT:
+            continue
+        fields = _children(data, point)
+        if CUE_TIME not in fields:
+            continue
+        for positions in iter_elements(data, point.body, point.end):
+            if positions.id != CUE_TRACK_POSITIONS:
+                continue
+            track = _children(data, positions)
+            if CUE_CLUSTER_POSITION not in track:
+                continue
+            if info.video_track is not None and CUE_TRACK in track \
+                    and read_uint(data, track[CUE_TRACK]) != info.video_track:
+                continue
+            times.append(read_uint(data, fields[CUE_TIME]) * info.timecode_scale / 1e9)
+            offsets.append(info.data_start + read_uint(data, track[CUE_CLUSTER_POSITION]))
+            break
+    return times, offsets
+
+
+async def read_cues(fetch: FetchPart, info: SegmentInfo, file_size: int, window: int = 1) -> Tuple[bytes, int]:
+    """The raw Cues element and its end offset"""
+    if info.cues is None:
+        raise MkvError("no Cues (file has no seek index)")
+    head = await read_bytes(fetch, info.cues, min(info.cues + 15, file_size - 1))
+    element = read_element(head, 0)
+    if element.size == UNKNOWN_SIZE:
+        raise MkvError("Cues element has unknown size")
+    end = min(info.cues + element.header + element.size, file_size)
+    return await read_bytes(fetch, info.cues, end - 1, window), end
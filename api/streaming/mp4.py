@@ -0,0 +1,195 @@
+# ==================== api/streaming/mp4.py ====================
+import itertools
+import struct
+from typing import Iterator, List, NamedTuple, Optional
+
+from api.streaming.readahead import FetchPart
+from api.streaming.ranges import read_bytes
+
+# Boxes that only contain other boxes, on the way down to the sample tables
+CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'edts', b'dinf', b'mvex'}
+
+class Mp4Error(ValueError):
+    """The file is not an MP4 we can make sense of"""
+
+
+class Box(NamedTuple):
+    type: bytes
+    start: int  # offset of the box header
+    header: int  # header length (8, or 16 with a 64-bit size)
+    size: int
+
+    @property
+    def end(self) -> int:
+        return self.start + self.size
+
+    @property
+    def body(self) -> int:
+        return self.start + self.header
+
+
+def _parse_header(data, pos: int, limit: int) -> Box:
+    if pos + 8 > len(data):
+        raise Mp4Error(f"truncated box header at {pos}")
+    size, box_type = struct.unpack_from('>I4s', data, pos)
+    header = 8
+    if size == 1:
+        if pos + 16 > len(data):
+            raise Mp4Error(f"truncated box header at {pos}")
+        size = struct.unpack_from('>Q', data, pos + 8)[0]
+        header = 16
+    elif size == 0:
+        size = limit - pos
+    if size < header:
+        raise Mp4Error(f"bad size {size} for box {box_type!r} at {pos}")
+    return Box(box_type, pos, header, size)
+
+
+def iter_boxes(data, start: int = 0, end: Optional[int] = None) -> Iterator[Box]:
+    """Boxes laid out back to back in `data[start:end]`"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        box = _parse_header(data, pos, end)
+        if box.end > end:
+            raise Mp4Error(f"box {box.type!r} at {pos} overruns its parent")
+        yield box
+        pos = box.end
+
+
+def walk(data, start: int = 0, end: Optional[int] = None) -> Iterator[Box]:
+    """Every box below `data[start:end]`, descending into containers"""
+    for box in iter_boxes(data, start, end):
+        yield box
+        if box.type in CONTAINERS:
+            yield from walk(data, box.body, box.end)
+
+
+def find(data, path: List[bytes], start: int = 0, end: Optional[int] = None) -> List[Box]:
+    """All boxes matching `path` (e.g. [b'trak', b'mdia']) below `data[start:end]`"""
+    matches = [box for box in iter_boxes(data, start, end) if box.type == path[0]]
+    if len(path) == 1:
+        return matches
+    return [found for box in matches for found in find(data, path[1:], box.body, box.end)]
+
+
+async def scan_top_level(fetch: FetchPart, file_size: int, window: int = 1) -> List[Box]:
+    """
+    List the top-level boxes of a remote MP4 by reading only their headers.
+
+    A typical file has a handful (ftyp, free, mdat, moov), so this costs a
+    few small precise reads no matter how large the media data is.
+    """
+    boxes = []
+    pos = 0
+    while pos + 8 <= file_size:
+        head = await read_bytes(fetch, pos, min(pos + 15, file_size - 1), window)
+        box = _parse_header(head, 0, file_size - pos)
+        box = box._replace(start=pos)
+        if not boxes and box.type != b'ftyp':
+            raise Mp4Error("no ftyp box at the start of the file")
+        boxes.append(box)
+        pos = box.end
+    if pos != file_size:
+        raise Mp4Error(f"top-level boxes end at {pos}, file is {file_size} bytes")
+    return boxes
+
+
+def full_box(data, box: Box):
+    """Version and flags of a full box, and the offset of its payload"""
+    version_flags = struct.unpack_from('>I', data, box.body)[0]
+    return version_flags >> 24, version_flags & 0xFFFFFF, box.body + 4
+
+
+def read_table(data, box: Box, fields: str):
+    """Entry count and flat tuple of a sample-table box's entries"""
+    _, _, pos = full_box(data, box)
+    count = struct.unpack_from('>I', data, pos)[0]
+    width = struct.calcsize('>' + fields)
+    if pos + 4 + count * width > box.end:
+        raise Mp4Error(f"{box.type!r} table overruns its box")
+    layout = f'>{count}{fields}' if len(fields) == 1 else '>' + fields * count
+    return count, struct.unpack_from(layout, data, pos + 4)
+
+
+def media_header(data, mdhd: Box):
+    """Timescale and duration (in timescale units) of a track's mdhd"""
+    version, _, pos = full_box(data, mdhd)
+    if version == 1:
+        return struct.unpack_from('>IQ', data, pos + 16)
+    return struct.unpack_from('>II', data, pos + 8)
+
+
+def _video_track(data, traks: List[Box]) -> Optional[Box]:
+    for trak in traks:
+        for hdlr in find(data, [b'mdia', b'hdlr'], trak.body, trak.end):
+            # version/flags, pre_defined, then the handler type
+            if data[hdlr.body + 8:hdlr.body + 12] == b'vide':
+                return trak
+    return None
+
+
+def keyframes(moov, min_gap: float = 1.0):
+    """
+    Sync-sample times (seconds) and byte offsets of the video track in `moov`.
+
+    Walks stts/stss/stsc/stsz/stco the way a demuxer would, keeping at most
+    one keyframe per `min_gap` seconds so all-intra tracks stay compact.
+    Returns (times, offsets, duration).
+    """
+    trak = _video_track(moov, find(moov, [b'moov', b'trak']))
+    if trak is None:
+        raise Mp4Error("no video track")
+
+    mdhd = find(moov, [b'mdia', b'mdhd'], trak.body, trak.end)
+    stbl = find(moov, [b'mdia', b'minf', b'stbl'], trak.body, trak.end)
+    if not mdhd or not stbl:
+        raise Mp4Error("video track has no mdhd/stbl")
+    timescale, duration = media_header(moov, mdhd[0])
+    if not timescale:
+        raise Mp4Error("zero timescale")
+
+    tables = {box.type: box for box in iter_boxes(moov, stbl[0].body, stbl[0].end)}
+    if b'stts' not in tables or b'stsc' not in tables or b'stsz' not in tables:
+        raise Mp4Error("incomplete sample tables")
+    _, stts = read_table(moov, tables[b'stts'], 'II')
+    _, stsc = read_table(moov, tables[b'stsc'], 'III')
+    sync = set(read_table(moov, tables[b'stss'], 'I')[1]) if b'stss' in tables else None
+    if b'co64' in tables:
+        _, chunk_offsets = read_table(moov, tables[b'co64'], 'Q')
+    elif b'stco' in tables:
+        _, chunk_offsets = read_table(moov, tables[b'stco'], 'I')
+    else:
+        raise Mp4Error("no chunk offset table")
+
+    _, _, pos = full_box(moov, tables[b'stsz'])
+    sample_size, sample_count = struct.unpack_from('>II', moov, pos)
+    if sample_size:
+        sizes = None
+    else:
+        if pos + 8 + sample_count * 4 > tables[b'stsz'].end:
+            raise Mp4Error("stsz table overruns its box")
+        sizes = struct.unpack_from(f'>{sample_count}I', moov, pos + 8)
+
+    # Run-length tables expanded on the fly
+    deltas = itertools.chain.from_iterable(
+        itertools.repeat(stts[i + 1], stts[i]) for i in range(0, len(stts), 2)
+    )
+    runs = [(stsc[i], stsc[i + 1]) for i in range(0, len(stsc), 3)]
+
+    times, offsets = [], []
+    sample, clock, run = 1, 0, 0
+    for chunk, offset in enumerate(chunk_offsets, 1):
+        while run + 1 < len(runs) and runs[run + 1][0] <= chunk:
+            run += 1
+        for _ in range(runs[run][1] if runs else 0):
+            if sample > sample_count:
+                break
+            seconds = clock / timescale
+            if (sync is None or sample in sync) and (not times or seconds - times[-1] >= min_gap):
+                times.append(seconds)
+                offsets.append(offset)
+            offset += sizes[sample - 1] if sizes else sample_size
+            clock += next(deltas, 0)
+            sample += 1
+    return times, offsets, duration / timescale
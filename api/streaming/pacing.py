@@ -0,0 +1,38 @@
+# ==================== api/streaming/pacing.py ====================
+import asyncio
+import time
+from contextlib import aclosing
+from typing import AsyncGenerator, AsyncIterator, Optional
+
+# Deliver somewhat faster than the average bitrate: VBR peaks and small
+# stalls on the client side shouldn't drain the player's buffer
+PACE_HEADROOM = 1.5
+
+def playback_rate(file_data: dict) -> Optional[float]:
+    """Average bytes per second of playback, from the stored size and duration"""
+    size = file_data.get('size') or 0
+    duration = file_data.get('duration') or 0
+    if size <= 0 or duration <= 0:
+        return None
+    return size / duration
+
+
+async def paced(chunks: AsyncIterator, rate: float, ahead: float) -> AsyncGenerator:
+    """
+    Relay `chunks` at most `ahead` seconds of playback ahead of the viewer.
+
+    The first `ahead` seconds go out as fast as they can be fetched so the
+    player starts quickly; after that delivery follows the playback rate.
+    Because the read-ahead only runs a few parts in front of delivery, this
+    also stops fetching from Telegram for viewers who stopped watching.
+    """
+    rate *= PACE_HEADROOM
+    started = time.monotonic()
+    sent = 0
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            allowed = (time.monotonic() - started + ahead) * rate
+            if sent > allowed:
+                await asyncio.sleep((sent - allowed) / rate)
+            yield chunk
+            sent += len(chunk)
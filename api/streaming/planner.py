@@ -0,0 +1,53 @@
+# ==================== api/streaming/planner.py ====================
+from typing import List, NamedTuple
+
+from config import config
+
+CHUNK_SIZE = 1024 * 1024  # GetFile maximum; parts never cross a 1MB boundary
+ALIGN = 4096  # GetFile offsets and limits must be 4KB multiples
+
+class Part(NamedTuple):
+    """One GetFile request and the slice of its bytes that belongs to the response"""
+    offset: int
+    limit: int
+    start: int
+    end: int
+    index: int = 0  # which requested range this part serves
+
+    @property
+    def precise(self) -> bool:
+        return self.limit != CHUNK_SIZE
+
+def _align_up(value: int) -> int:
+    return -(-value // ALIGN) * ALIGN
+
+def plan_range(from_bytes: int, until_bytes: int, precise_max: int = None) -> List[Part]:
+    """
+    Plan the GetFile requests needed to serve bytes `from_bytes`..`until_bytes`.
+
+    Short ranges (player probes, MP4 index reads near the end of the file)
+    fetch only the 4KB-aligned span they need. Longer ranges use full aligned
+    1MB parts so sequential playback stays cacheable and pipelines well.
+    """
+    if precise_max is None:
+        precise_max = config.STREAM_PRECISE_MAX_KB * 1024
+
+    parts = []
+    if until_bytes - from_bytes + 1 <= precise_max:
+        pos = from_bytes
+        while pos <= until_bytes:
+            block_end = (pos // CHUNK_SIZE + 1) * CHUNK_SIZE
+            end = min(until_bytes + 1, block_end)
+            offset = pos - pos % ALIGN
+            limit = min(_align_up(end), block_end) - offset
+            parts.append(Part(offset, limit, pos - offset, end - offset))
+            pos = end
+        return parts
+
+    offset = from_bytes - from_bytes % CHUNK_SIZE
+    while offset <= until_bytes:
+        start = max(from_bytes - offset, 0)
+        end = min(until_bytes + 1 - offset, CHUNK_SIZE)
+        parts.append(Part(offset, CHUNK_SIZE, start, end))
+        offset += CHUNK_SIZE
+    return parts
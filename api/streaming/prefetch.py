@@ -0,0 +1,67 @@
+# ==================== api/streaming/prefetch.py ====================
+import asyncio
+
+from config import config
+from api.streaming.cache import chunk_cache
+from api.streaming.fetcher import open_fetcher
+from api.streaming.hotstart import hot_offsets, hot_store
+from api.streaming.planner import CHUNK_SIZE
+from api.streaming.seekindex import seek_index
+
+MAX_JOBS = 8  # files being prefetched at once
+
+_active = set()
+_tasks = set()
+
+def start_prefetch(file_data: dict, client: str = ""):
+    """
+    Warm the chunk cache for a file whose player page is being rendered.
+
+    The player's first requests follow within a second: the head of the
+    file, and the container headers (MP4 moov, MKV Cues). With a seek index
+    those are fetched exactly; without one the last MB stands in for them.
+    These parts are fetched in the background, so those requests are served
+    from the cache or join the fetch already in flight.
+    """
+    if config.STREAM_PREFETCH_HEAD_MB <= 0:
+        return
+    unique_id = file_data.get('telegramFileUniqueId')
+    if not unique_id or unique_id in _active or not file_data.get('telegramFileId'):
+        return
+    if len(_active) >= MAX_JOBS:
+        return
+
+    _active.add(unique_id)
+    task = asyncio.ensure_future(_prefetch(file_data, unique_id, client))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def prefetch_offsets(file_data: dict) -> list:
+    """Parts a player is about to read that are not cached yet"""
+    unique_id = file_data['telegramFileUniqueId']
+    file_size = file_data.get('size', 0)
+    offsets = hot_offsets(file_size, config.STREAM_PREFETCH_HEAD_MB)
+    index = await seek_index.get(file_data)
+    if index is not None:
+        # The index knows where the headers are; drop the last-MB guess
+        head = [o for o in offsets if o < config.STREAM_PREFETCH_HEAD_MB * CHUNK_SIZE]
+        offsets = head + [o for o in index.header_offsets() if o not in head and o < file_size]
+    return [
+        offset for offset in offsets
+        if not chunk_cache.contains(unique_id, offset) and not hot_store.contains(unique_id, offset)
+    ]
+
+
+async def _prefetch(file_data: dict, unique_id: str, client: str):
+    try:
+        offsets = await prefetch_offsets(file_data)
+        if not offsets:
+            return
+        # Fetched as playback traffic on behalf of the viewer about to press play
+        fetch_part = await open_fetcher(file_data, client_ip=client)
+        await asyncio.gather(*(fetch_part(offset, CHUNK_SIZE) for offset in offsets))
+    except Exception as e:
+        print(f"[PREFETCH] Failed to prefetch {file_data.get('_id')}: {e}")
+    finally:
+        _active.discard(unique_id)
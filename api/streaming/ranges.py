@@ -0,0 +1,221 @@
+# ==================== api/streaming/ranges.py ====================
+import itertools
+import secrets
+from contextlib import aclosing
+from typing import AsyncGenerator, Dict, List, NamedTuple, Optional, Tuple
+
+from api.streaming.buffers import Chunk, allocations, view
+from api.streaming.planner import CHUNK_SIZE, Part, plan_range
+from api.streaming.readahead import FetchPart, iter_parts
+from api.streaming.stream_sessions import StreamSession
+
+MAX_RANGES = 16  # more than this is coalesced into one span
+
+ByteRange = Tuple[int, int]  # inclusive (first, last)
+
+class RangeNotSatisfiable(Exception):
+    """The Range header is valid but none of its ranges overlap the file"""
+
+def parse_range_header(header: str, file_size: int) -> Optional[List[ByteRange]]:
+    """
+    Parse an RFC 7233 `Range` header into sorted, coalesced inclusive ranges.
+
+    Supports `first-last`, open `first-` and suffix `-length` specs, and any
+    number of comma-separated ranges. Returns None when the header is absent,
+    malformed or not in bytes (the full file should be sent), and raises
+    RangeNotSatisfiable when it is valid but nothing in it can be served.
+    """
+    if not header:
+        return None
+
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+        first, dash, last = spec.partition('-')
+        first, last = first.strip(), last.strip()
+        if not dash or (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+
+        if not first:
+            if not last:
+                return None
+            # Suffix range: the final `last` bytes
+            length = int(last)
+            if length == 0:
+                continue
+            ranges.append((max(file_size - length, 0), file_size - 1))
+            continue
+
+        first = int(first)
+        if last and int(last) < first:
+            return None
+        # Checked before an open range is clamped to the file, or
+        # `bytes=<size>-` would look malformed rather than unsatisfiable
+        if first >= file_size:
+            continue
+        last = int(last) if last else file_size - 1
+        ranges.append((first, min(last, file_size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for first, last in ranges[1:]:
+        prev_first, prev_last = merged[-1]
+        if first <= prev_last + 1:
+            merged[-1] = (prev_first, max(prev_last, last))
+        else:
+            merged.append((first, last))
+
+    if len(merged) > MAX_RANGES:
+        merged = [(merged[0][0], merged[-1][1])]
+    return merged
+
+def content_range(first: int, last: int, file_size: int) -> str:
+    return f'bytes {first}-{last}/{file_size}'
+
+def new_boundary() -> str:
+    return secrets.token_hex(16)
+
+def _part_header(boundary: str, mime_type: str, first: int, last: int, file_size: int, leading: bool) -> bytes:
+    return (
+        ('' if leading else '\r\n')
+        + f'--{boundary}\r\n'
+        + f'Content-Type: {mime_type}\r\n'
+        + f'Content-Range: {content_range(first, last, file_size)}\r\n\r\n'
+    ).encode()
+
+def _closing(boundary: str) -> bytes:
+    return f'\r\n--{boundary}--\r\n'.encode()
+
+def multipart_length(ranges: List[ByteRange], file_size: int, mime_type: str, boundary: str) -> int:
+    """Exact Content-Length of the multipart/byteranges body for `ranges`"""
+    length = len(_closing(boundary))
+    for index, (first, last) in enumerate(ranges):
+        length += len(_part_header(boundary, mime_type, first, last, file_size, index == 0))
+        length += last - first + 1
+    return length
+
+class RangeResponse(NamedTuple):
+    status_code: int
+    ranges: List[ByteRange]
+    boundary: Optional[str]
+    headers: Dict[str, str]
+
+def plan_response(range_header: str, file_size: int, mime_type: str) -> RangeResponse:
+    """
+    Work out status, ranges and entity headers for a (possibly ranged) GET.
+
+    Raises RangeNotSatisfiable; the caller answers 416 with
+    `Content-Range: bytes */<size>`.
+    """
+    ranges = parse_range_header(range_header, file_size)
+    headers = {'Accept-Ranges': 'bytes'}
+
+    if ranges is None:
+        ranges = [(0, file_size - 1)] if file_size > 0 else []
+        headers['Content-Type'] = mime_type
+        headers['Content-Length'] = str(max(file_size, 0))
+        return RangeResponse(200, ranges, None, headers)
+
+    if len(ranges) == 1:
+        first, last = ranges[0]
+        headers['Content-Type'] = mime_type
+        headers['Content-Length'] = str(last - first + 1)
+        headers['Content-Range'] = content_range(first, last, file_size)
+        return RangeResponse(206, ranges, None, headers)
+
+    boundary = new_boundary()
+    headers['Content-Type'] = f'multipart/byteranges; boundary={boundary}'
+    headers['Content-Length'] = str(multipart_length(ranges, file_size, mime_type, boundary))
+    return RangeResponse(206, ranges, boundary, headers)
+
+async def stream_ranges(
+    fetch: FetchPart,
+    ranges: List[ByteRange],
+    file_size: int,
+    window: int,
+    mime_type: str = None,
+    boundary: str = None,
+    session: Optional[StreamSession] = None,
+) -> AsyncGenerator[Chunk, None]:
+    """
+    Yield the body for `ranges` from one planned fetch sequence.
+
+    All ranges are planned up front and fed through a single read-ahead
+    pipeline, so a request for the head and the tail of a file keeps fetches
+    in flight across the gap. With a `boundary` the output is framed as
+    multipart/byteranges; otherwise the raw bytes of the ranges are yielded.
+    With a `session` the window and any warm read-ahead carry over from the
+    client's previous request, and are handed back to it at the end.
+    """
+    parts = [
+        part._replace(index=index)
+        for index, (first, last) in enumerate(ranges)
+        for part in plan_range(first, last)
+    ]
+
+    adopt = None
+    if session is not None and ranges:
+        generation = session.begin(ranges[0][0])
+        window = session.window
+        source = fetch
+        fetch = session.wrap(source)
+        adopt = lambda pending: session.adopt(generation, pending, source, file_size)
+
+    current = None
+    # aclosing: stopping this generator must cancel the read-ahead right away
+    async with aclosing(iter_parts(fetch, parts, window, adopt)) as chunks:
+        async for part, chunk in chunks:
+            if boundary and part.index != current:
+                first, last = ranges[part.index]
+                yield _part_header(boundary, mime_type, first, last, file_size, current is None)
+                current = part.index
+            body = view(chunk, part.start, part.end)
+            allocations.record_delivery(body)
+            if adopt is not None:
+                session.advance(generation, part.offset + part.end)
+            yield body
+
+    if boundary and ranges:
+        yield _closing(boundary)
+
+
+async def stream_bytes(
+    fetch: FetchPart,
+    from_bytes: int = 0,
+    until_bytes: Optional[int] = None,
+    window: int = 1,
+) -> AsyncGenerator[Chunk, None]:
+    """
+    Yield bytes `from_bytes`..`until_bytes` (inclusive) of a file.
+
+    For callers that don't know the file size: with `until_bytes` None the
+    file is read in 1MB parts until Telegram returns an empty one.
+    """
+    if until_bytes is not None:
+        parts = plan_range(from_bytes, until_bytes)
+    else:
+        parts = (
+            Part(offset, CHUNK_SIZE, max(from_bytes - offset, 0), CHUNK_SIZE)
+            for offset in itertools.count(from_bytes - from_bytes % CHUNK_SIZE, CHUNK_SIZE)
+        )
+
+    async with aclosing(iter_parts(fetch, parts, window)) as chunks:
+        async for part, chunk in chunks:
+            body = view(chunk, part.start, part.end)
+            allocations.record_delivery(body)
+            if body:
+                yield body
+
+
+async def read_bytes(fetch: FetchPart, first: int, last: int, window: int = 1) -> bytes:
+    """Bytes `first`..`last` (inclusive) as one buffer, for parsing container headers"""
+    return b"".join([chunk async for chunk in stream_bytes(fetch, first, last, window)])
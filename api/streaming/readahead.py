@@ -0,0 +1,93 @@
+# ==================== api/streaming/readahead.py ====================
+import asyncio
+from collections import deque
+from typing import AsyncGenerator, Awaitable, Callable, Iterable, Optional, Tuple
+
+# fetch(offset, limit) -> bytes for one part of the file
+FetchPart = Callable[[int, int], Awaitable[bytes]]
+
+
+class DeliveryStats:
+    """Counts read-ahead work thrown away because the consumer went away"""
+
+    def __init__(self):
+        self.abandoned_streams = 0
+        self.cancelled_fetches = 0
+        self.wasted_bytes = 0  # fetched from upstream but never delivered
+
+    def record_abandoned(self, tasks):
+        self.abandoned_streams += 1
+        for task in tasks:
+            if not task.done():
+                self.cancelled_fetches += 1
+            elif not task.cancelled() and task.exception() is None:
+                self.wasted_bytes += len(task.result() or b"")
+
+    def stats(self) -> dict:
+        return {
+            'abandonedStreams': self.abandoned_streams,
+            'cancelledFetches': self.cancelled_fetches,
+            'wastedBytes': self.wasted_bytes,
+        }
+
+
+delivery = DeliveryStats()
+
+
+async def iter_parts(
+    fetch: FetchPart,
+    parts: Iterable[Tuple[int, int]],
+    window: int = 1,
+    adopt: Optional[Callable[[list], list]] = None,
+) -> AsyncGenerator[Tuple[tuple, bytes], None]:
+    """
+    Fetch each part in `parts` and yield (part, bytes) pairs in order.
+
+    Up to `window` fetches are kept in flight so each part no longer pays a
+    full round trip after the previous one was consumed. Pending fetches are
+    cancelled as soon as the consumer stops early (disconnect, seek or
+    close), and whatever they had already fetched is counted as waste.
+
+    Args:
+        fetch: Coroutine function returning the bytes at (offset, limit).
+        parts: Tuples starting with (offset, limit), in delivery order.
+        window: Maximum number of fetches in flight.
+        adopt: Called with the (part, task) pairs still pending when
+            iteration ends; returns the ones it did not take over, which
+            are cancelled as usual.
+
+    Yields:
+        tuple: The part and its bytes; stops at the first empty result.
+    """
+    window = max(1, window)
+    parts = iter(parts)
+    pending = deque()
+
+    def schedule() -> bool:
+        part = next(parts, None)
+        if part is None:
+            return False
+        pending.append((part, asyncio.ensure_future(fetch(part[0], part[1]))))
+        return True
+
+    try:
+        while len(pending) < window and schedule():
+            pass
+
+        while pending:
+            part, task = pending.popleft()
+            chunk = await task
+            schedule()
+            if not chunk:
+                break
+            yield part, chunk
+    finally:
+        if adopt is not None:
+            pending = adopt(list(pending))
+        tasks = [task for _, task in pending]
+        if tasks:
+            delivery.record_abandoned(tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
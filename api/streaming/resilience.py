@@ -0,0 +1,73 @@
+# ==================== api/streaming/resilience.py ====================
+import time
+
+from pyrogram.errors import InternalServerError, ServiceUnavailable
+
+from config import config
+
+# Errors worth retrying on another session; pyrogram raises the builtin TimeoutError
+RETRYABLE_ERRORS = (OSError, TimeoutError, InternalServerError, ServiceUnavailable)
+
+class DCUnavailable(Exception):
+    """The circuit breaker for a DC is open; fail fast instead of queueing"""
+
+class CircuitBreaker:
+    """
+    Per-DC circuit breaker.
+
+    After `threshold` consecutive failed fetches the breaker opens and new
+    fetches fail immediately for `cooldown` seconds. The first fetch after the
+    cooldown is let through as a trial: success closes the breaker, failure
+    opens it again.
+    """
+
+    def __init__(self, dc_id: int, threshold: int, cooldown: float):
+        self.dc_id = dc_id
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def check(self):
+        if self.threshold <= 0 or not self.is_open:
+            return
+        now = time.monotonic()
+        if now - self.opened_at < self.cooldown:
+            raise DCUnavailable(f"DC {self.dc_id} is unavailable")
+        # One trial fetch at a time; a trial that never reported back expires
+        if self._trial_at is not None and now - self._trial_at < self.cooldown:
+            raise DCUnavailable(f"DC {self.dc_id} is unavailable")
+        self._trial_at = now
+
+    def record_success(self):
+        if self.is_open:
+            print(f"[RESILIENCE] DC {self.dc_id} recovered, closing circuit")
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_at is not None or (self.threshold > 0 and self.failures >= self.threshold and not self.is_open):
+            print(f"[RESILIENCE] DC {self.dc_id} failing ({self.failures} in a row), opening circuit")
+            self.opened_at = time.monotonic()
+            self._trial_at = None
+
+
+_breakers = {}
+
+def get_breaker(dc_id: int) -> CircuitBreaker:
+    breaker = _breakers.get(dc_id)
+    if breaker is None:
+        breaker = CircuitBreaker(dc_id, config.DC_BREAKER_THRESHOLD, config.DC_BREAKER_COOLDOWN)
+        _breakers[dc_id] = breaker
+    return breaker
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff: 0.25s, 0.5s, 1s, ... capped at 4s"""
+    return min(0.25 * (2 ** (attempt - 1)), 4.0)
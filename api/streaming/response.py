@@ -0,0 +1,63 @@
+# ==================== api/streaming/response.py ====================
+from contextlib import aclosing
+from typing import AsyncGenerator, AsyncIterator, Callable, Optional
+
+import anyio
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from api.streaming.readahead import delivery
+
+class ChunkStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that passes memoryview chunks through untouched.
+
+    The pinned Starlette only accepts bytes/str from the body iterator, which
+    would force every cached (mmap-backed) chunk to be copied into bytes. The
+    body iterator is also closed as soon as streaming stops, instead of
+    whenever it gets garbage collected, so its read-ahead is cancelled
+    promptly on disconnect. `on_close` runs once the response is over, however
+    it ended, e.g. to release the stream's admission slot.
+    """
+
+    def __init__(self, *args, on_close: Optional[Callable[[], None]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.on_close:
+                self.on_close()
+
+    async def stream_response(self, send) -> None:
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers,
+                }
+            )
+            async for chunk in self.body_iterator:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode(self.charset)
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            if hasattr(self.body_iterator, "aclose"):
+                # Shielded: on disconnect this runs inside a cancelled task group
+                with anyio.CancelScope(shield=True):
+                    await self.body_iterator.aclose()
+
+
+async def until_disconnected(request: Request, chunks: AsyncIterator) -> AsyncGenerator:
+    """Relay `chunks` until the client goes away, then close them"""
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            if await request.is_disconnected():
+                delivery.wasted_bytes += len(chunk)
+                break
+            yield chunk
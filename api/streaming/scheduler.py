@@ -0,0 +1,241 @@
+# ==================== api/streaming/scheduler.py ====================
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import NamedTuple
+
+from config import config
+
+class Priority(IntEnum):
+    """Traffic class of a fetch; see CLASS_WEIGHTS for how they share a DC"""
+    PLAYBACK = 0
+    DOWNLOAD = 1
+    BACKGROUND = 2
+
+
+class Flow(NamedTuple):
+    """Who a fetch is for: the unit the fair-share scheduler divides capacity by"""
+    priority: Priority = Priority.PLAYBACK
+    client: str = ""  # client IP
+    file: str = ""    # file unique ID
+
+
+CLASS_WEIGHTS = {
+    Priority.PLAYBACK: config.FAIR_WATCH_WEIGHT,
+    Priority.DOWNLOAD: 1.0,
+    Priority.BACKGROUND: 0.25,
+}
+
+
+class TokenBucket:
+    """Requests-per-second limiter; a rate of 0 means unlimited"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate > 0:
+            self._refill()
+            self.tokens -= 1
+
+    def try_take(self) -> bool:
+        if self.wait_time() > 0:
+            return False
+        self.take()
+        return True
+
+
+class DCScheduler:
+    """
+    Admits media requests for one account on one DC.
+
+    Requests are released at the DC's token-bucket rate, and at most
+    `max_inflight` run at once; a slot is held until release(). When they
+    have to queue, they are ordered by self-clocked weighted fair queueing: each
+    client IP gets a share weighted by its traffic class (watching weighs
+    more than downloading), split evenly across the files it is fetching.
+    A download manager with many connections therefore can't crowd out
+    viewers, but still uses whatever capacity they leave.
+
+    A FloodWait seen by any request pauses the whole DC for its duration, so
+    the other streams stop hammering it instead of each hitting the limit.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, max_inflight: int = 0):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self._freed = asyncio.Event()
+        self.paused_until = 0.0
+        self.flood_waits = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self._dispatcher = None
+        self._vtime = 0.0
+        self._finish = {}  # (client, file) -> finish tag of its last queued request
+        self._client_files = {}  # client -> Counter of queued requests per file
+
+    def _wait_time(self) -> float:
+        return max(self.paused_until - time.monotonic(), self.bucket.wait_time(), 0.0)
+
+    def _full(self) -> bool:
+        return 0 < self.max_inflight <= self.inflight
+
+    def _take(self):
+        self.bucket.take()
+        self.inflight += 1
+
+    async def acquire(self, flow: Flow = Flow()):
+        """Wait for a slot; every acquire (and successful try_acquire) needs a release()"""
+        if not self._queue and not self._full() and self._wait_time() == 0:
+            self._take()
+            return
+
+        files = self._client_files.setdefault(flow.client, Counter())
+        files[flow.file] += 1
+        weight = CLASS_WEIGHTS[flow.priority] / len(files)
+        key = (flow.client, flow.file)
+        tag = max(self._vtime, self._finish.get(key, 0.0)) + 1 / weight
+        self._finish[key] = tag
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (tag, next(self._seq), future, flow))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        # A cancelled waiter leaves a done future behind; the dispatcher skips it
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # granted just as the waiter went away
+            raise
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now (used for optional hedges)"""
+        if self._queue or self._full() or self._wait_time() > 0:
+            return False
+        self._take()
+        return True
+
+    def release(self):
+        self.inflight -= 1
+        self._freed.set()
+
+    @asynccontextmanager
+    async def slot(self, flow: Flow = Flow()):
+        await self.acquire(flow)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _pop(self):
+        tag, _, future, flow = heapq.heappop(self._queue)
+        files = self._client_files[flow.client]
+        files[flow.file] -= 1
+        if not files[flow.file]:
+            del files[flow.file]
+            self._finish.pop((flow.client, flow.file), None)
+            if not files:
+                del self._client_files[flow.client]
+        return tag, future
+
+    async def _dispatch(self):
+        while self._queue:
+            if self._queue[0][2].done():
+                self._pop()
+                continue
+            if self._full():
+                self._freed.clear()
+                await self._freed.wait()
+                continue
+            wait = self._wait_time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            self._take()
+            self._vtime, future = self._pop()
+            future.set_result(None)
+        self._vtime = 0.0
+
+    def flood_wait(self, seconds: float):
+        until = time.monotonic() + seconds
+        if until > self.paused_until:
+            self.paused_until = until
+            self.flood_waits += 1
+            print(f"[SCHEDULER] {self.name}: FloodWait {seconds}s, pausing all requests")
+
+    def stats(self) -> dict:
+        return {
+            'queued': sum(1 for _, _, f, _ in self._queue if not f.done()),
+            'inflight': self.inflight,
+            'clients': len(self._client_files),
+            'pausedFor': max(round(self.paused_until - time.monotonic(), 1), 0),
+            'floodWaits': self.flood_waits,
+        }
+
+
+_schedulers = {}
+
+def get_scheduler(client, dc_id: int) -> DCScheduler:
+    """Flood limits are per account, so each client gets its own scheduler per DC"""
+    key = (client.name, dc_id)
+    scheduler = _schedulers.get(key)
+    if scheduler is None:
+        scheduler = DCScheduler(
+            f"{client.name}/DC{dc_id}", config.MEDIA_DC_RATE, config.MEDIA_DC_BURST,
+            config.MEDIA_DC_MAX_INFLIGHT
+        )
+        _schedulers[key] = scheduler
+    return scheduler
+
+
+def scheduler_stats() -> dict:
+    return {scheduler.name: scheduler.stats() for scheduler in _schedulers.values()}
+
+
+class ClientSlots:
+    """Caps how many upstream fetches one client IP can have in flight"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._slots = {}  # client -> [semaphore, users]
+
+    @asynccontextmanager
+    async def slot(self, client: str):
+        if self.limit <= 0 or not client:
+            yield
+            return
+        entry = self._slots.get(client)
+        if entry is None:
+            entry = self._slots[client] = [asyncio.Semaphore(self.limit), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._slots[client]
+
+
+client_slots = ClientSlots(config.FAIR_CLIENT_MAX_INFLIGHT)
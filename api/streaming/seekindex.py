@@ -0,0 +1,231 @@
+# ==================== api/streaming/seekindex.py ====================
+import asyncio
+import bisect
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+
+from config import config
+from database.operations import get_seek_index, save_seek_index
+from api.streaming.faststart import is_mp4, patch_chunk_offsets
+from api.streaming.fetcher import open_fetcher
+from api.streaming.mkv import MkvError, parse_cues, read_cues, scan_head
+from api.streaming.mp4 import Mp4Error, keyframes, scan_top_level
+from api.streaming.planner import CHUNK_SIZE
+from api.streaming.ranges import ByteRange, read_bytes
+from api.streaming.scheduler import Priority
+
+MKV_TYPES = {'video/x-matroska', 'video/webm', 'audio/x-matroska', 'audio/webm'}
+MKV_EXTENSIONS = ('.mkv', '.webm', '.mka')
+MAX_ENTRIES = 1024  # indexes kept in memory
+MAX_HEADER_PARTS = 16  # prefetch cap for one file's container headers
+INDEX_VERSION = 2  # bumped when stored indexes must be rebuilt
+
+def is_mkv(file_data: dict) -> bool:
+    name = (file_data.get('fileName') or '').lower()
+    return file_data.get('mimeType') in MKV_TYPES or name.endswith(MKV_EXTENSIONS)
+
+
+class SeekIndex(NamedTuple):
+    """
+    Keyframe times and byte offsets of one file, plus where its headers live.
+
+    Offsets are in the file as stored in Telegram. `shift` is set for MP4s
+    served with a faststart layout: (insert_at, moov_start, moov size).
+    """
+    container: str
+    duration: Optional[float]
+    times: List[float]
+    offsets: List[int]
+    header_ranges: List[ByteRange]
+    shift: Optional[Tuple[int, int, int]] = None
+
+    def keyframe(self, seconds: float) -> Optional[Tuple[float, int]]:
+        """The last keyframe at or before `seconds`, as (time, offset)"""
+        if not self.times:
+            return None
+        i = max(bisect.bisect_right(self.times, seconds) - 1, 0)
+        return self.times[i], self.offsets[i]
+
+    def virtual(self, offset: int) -> int:
+        """`offset` in the faststart layout of the file"""
+        if self.shift is None:
+            return offset
+        insert_at, moov_start, moov_size = self.shift
+        return offset + moov_size if insert_at <= offset < moov_start else offset
+
+    def header_offsets(self) -> List[int]:
+        """1MB-aligned parts covering the container headers"""
+        offsets = []
+        for first, last in self.header_ranges:
+            for offset in range(first - first % CHUNK_SIZE, last + 1, CHUNK_SIZE):
+                if offset not in offsets:
+                    offsets.append(offset)
+        return offsets[:MAX_HEADER_PARTS]
+
+    def to_doc(self) -> dict:
+        return {
+            'version': INDEX_VERSION,
+            'container': self.container,
+            'duration': self.duration,
+            'times': self.times,
+            'offsets': self.offsets,
+            'headerRanges': [list(r) for r in self.header_ranges],
+            'faststartShift': list(self.shift) if self.shift else None,
+        }
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> Optional['SeekIndex']:
+        if doc.get('error'):
+            return None
+        return cls(
+            doc['container'],
+            doc.get('duration'),
+            doc.get('times', []),
+            doc.get('offsets', []),
+            [tuple(r) for r in doc.get('headerRanges', [])],
+            tuple(doc['faststartShift']) if doc.get('faststartShift') else None,
+        )
+
+
+async def index_mp4(fetch, file_size: int) -> SeekIndex:
+    boxes = await scan_top_level(fetch, file_size)
+    moov = next((box for box in boxes if box.type == b'moov'), None)
+    mdat = next((box for box in boxes if box.type == b'mdat'), None)
+    if moov is None:
+        raise Mp4Error("no moov box")
+
+    data = await read_bytes(fetch, moov.start, moov.end - 1, config.STREAM_READAHEAD)
+    if len(data) != moov.size:
+        raise Mp4Error("short read of moov")
+    times, offsets, duration = await asyncio.to_thread(keyframes, data)
+
+    if mdat is None or moov.start < mdat.start:
+        return SeekIndex('mp4', duration, times, offsets, [(0, moov.end - 1)])
+
+    shift = (mdat.start, moov.start, moov.size)
+    try:
+        await asyncio.to_thread(patch_chunk_offsets, data, mdat.start, moov.start)
+    except Mp4Error:
+        shift = None  # faststart serves this file as stored
+    return SeekIndex('mp4', duration, times, offsets, [(0, mdat.start - 1), (moov.start, moov.end - 1)], shift)
+
+
+async def index_mkv(fetch, file_size: int) -> SeekIndex:
+    info = await scan_head(fetch, file_size)
+    data, cues_end = await read_cues(fetch, info, file_size, config.STREAM_READAHEAD)
+    times, offsets = await asyncio.to_thread(parse_cues, data, info)
+    return SeekIndex('mkv', info.duration, times, offsets, [(0, info.head_end - 1), (info.cues, cues_end - 1)])
+
+
+class SeekIndexer:
+    """
+    Builds keyframe indexes in the background and keeps recent ones in memory.
+
+    A build reads only the container metadata (MP4 moov, MKV head and Cues)
+    and stores the result in Mongo, so it runs once per Telegram file.
+    Files that can't be indexed are stored with an error and not retried;
+    transport failures are retried the next time the file is asked for.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._indexes: "OrderedDict[str, Optional[SeekIndex]]" = OrderedDict()
+        self._queue = None
+        self._queued = set()
+        self._building = {}
+        self._worker = None
+
+    @staticmethod
+    def indexable(file_data: dict) -> bool:
+        return bool(file_data.get('telegramFileUniqueId') and file_data.get('telegramFileId')) \
+            and (is_mp4(file_data) or is_mkv(file_data))
+
+    async def get(self, file_data: dict) -> Optional[SeekIndex]:
+        """The file's index if it has been built; otherwise queue a build"""
+        if not self.indexable(file_data):
+            return None
+        unique_id = file_data['telegramFileUniqueId']
+        if unique_id in self._indexes:
+            self._indexes.move_to_end(unique_id)
+            return self._indexes[unique_id]
+        if unique_id in self._queued or unique_id in self._building:
+            return None
+
+        doc = await get_seek_index(unique_id)
+        if doc is None or doc.get('version') != INDEX_VERSION:
+            self.queue(file_data)
+            return None
+        index = SeekIndex.from_doc(doc)
+        self._remember(unique_id, index)
+        return index
+
+    async def require(self, file_data: dict) -> Optional[SeekIndex]:
+        """The file's index, building it now if needed; None if it has none"""
+        index = await self.get(file_data)
+        if index is not None or not self.indexable(file_data):
+            return index
+        unique_id = file_data['telegramFileUniqueId']
+        if unique_id in self._indexes:
+            return None  # known to have no usable index
+        return await self._build_once(file_data)
+
+    def queue(self, file_data: dict):
+        if not self.indexable(file_data) or file_data['telegramFileUniqueId'] in self._queued:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._queued.add(file_data['telegramFileUniqueId'])
+        self._queue.put_nowait(file_data)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._index_loop())
+
+    async def _index_loop(self):
+        # One file at a time, as background traffic
+        while True:
+            file_data = await self._queue.get()
+            unique_id = file_data['telegramFileUniqueId']
+            try:
+                await self._build_once(file_data)
+            except Exception as e:
+                print(f"[SEEKINDEX] Failed to index {file_data.get('_id')}: {e}")
+            finally:
+                self._queued.discard(unique_id)
+
+    async def _build_once(self, file_data: dict) -> Optional[SeekIndex]:
+        unique_id = file_data['telegramFileUniqueId']
+        if unique_id in self._indexes:
+            return self._indexes[unique_id]
+        task = self._building.get(unique_id)
+        if task is None:
+            task = asyncio.ensure_future(self.build(file_data))
+            self._building[unique_id] = task
+            task.add_done_callback(lambda _: self._building.pop(unique_id, None))
+        return await asyncio.shield(task)
+
+    async def build(self, file_data: dict) -> Optional[SeekIndex]:
+        unique_id = file_data['telegramFileUniqueId']
+        file_size = file_data.get('size', 0)
+        fetch_part = await open_fetcher(file_data, Priority.BACKGROUND)
+        try:
+            if is_mp4(file_data):
+                index = await index_mp4(fetch_part, file_size)
+            else:
+                index = await index_mkv(fetch_part, file_size)
+        except (Mp4Error, MkvError) as e:
+            print(f"[SEEKINDEX] {file_data.get('fileName', unique_id)} has no usable index: {e}")
+            await save_seek_index(unique_id, {'version': INDEX_VERSION, 'error': str(e)})
+            self._remember(unique_id, None)
+            return None
+
+        await save_seek_index(unique_id, index.to_doc())
+        self._remember(unique_id, index)
+        print(f"[SEEKINDEX] Indexed {len(index.times)} keyframes of {file_data.get('fileName', unique_id)}")
+        return index
+
+    def _remember(self, unique_id: str, index: Optional[SeekIndex]):
+        self._indexes[unique_id] = index
+        while len(self._indexes) > self.max_entries:
+            self._indexes.popitem(last=False)
+
+
+seek_index = SeekIndexer(MAX_ENTRIES)
@@ -0,0 +1,270 @@
+# ==================== api/streaming/sessions.py ====================
+import asyncio
+import time
+from typing import List
+
+from pyrogram import raw
+from pyrogram.file_id import FileId
+from pyrogram.session import Session, Auth
+
+from config import config
+from api.streaming.scheduler import TokenBucket
+
+HEALTH_CHECK_INTERVAL = 30
+HEALTH_CHECK_TIMEOUT = 5
+
+class PooledSession:
+    """A media Session plus the bookkeeping the pool dispatches on"""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.outstanding = 0
+        self.last_used = time.monotonic()
+        self.dead = False
+        self.bucket = TokenBucket(config.MEDIA_SESSION_RATE, config.MEDIA_SESSION_RATE)
+
+    @property
+    def alive(self) -> bool:
+        return not self.dead and self.session.is_started.is_set()
+
+    async def invoke(self, query, **kwargs):
+        self.outstanding += 1
+        try:
+            # Per-connection rate limit, under the per-DC scheduler's
+            wait = self.bucket.wait_time()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self.bucket.wait_time()
+            self.bucket.take()
+            return await self.session.invoke(query, **kwargs)
+        except TimeoutError:
+            # One slow request says nothing about the connection's other requests;
+            # the health-check Ping decides whether it is dead
+            raise
+        except OSError:
+            self.dead = True
+            raise
+        finally:
+            self.outstanding -= 1
+            self.last_used = time.monotonic()
+
+
+class MediaSessionPool:
+    """
+    Up to `size` media sessions to one DC, dispatched by least outstanding requests.
+
+    Sessions are opened lazily as load grows, dead ones are dropped and
+    replaced on the next request, and sessions idle for longer than
+    `idle_timeout` are closed by the health-check loop (one is always kept).
+    """
+
+    def __init__(self, client, dc_id: int, size: int, idle_timeout: float):
+        self.client = client
+        self.dc_id = dc_id
+        self.size = max(1, size)
+        self.idle_timeout = idle_timeout
+        self.sessions: List[PooledSession] = []
+        self._creating = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def outstanding(self) -> int:
+        return sum(s.outstanding for s in self.sessions)
+
+    async def acquire(self, exclude=()) -> PooledSession:
+        """
+        Pick the session with the fewest outstanding requests.
+
+        Sessions in `exclude` (ones that just failed a request) are skipped;
+        if that leaves nothing, a fresh session is opened to fail over to.
+        """
+        self._drop_dead()
+        candidates = [s for s in self.sessions if s not in exclude]
+        if not candidates:
+            async with self._lock:
+                candidates = [s for s in self.sessions if s not in exclude]
+                if not candidates:
+                    candidates = [await self._add_session()]
+
+        best = min(candidates, key=lambda s: s.outstanding)
+        if best.outstanding > 0 and len(self.sessions) + self._creating < self.size:
+            # Grow in the background; this request rides the least loaded session.
+            # The slot is reserved now so concurrent acquires don't all grow.
+            self._creating += 1
+            asyncio.ensure_future(self._grow())
+        return best
+
+    async def invoke(self, query, **kwargs):
+        pooled = await self.acquire()
+        return await pooled.invoke(query, **kwargs)
+
+    async def _grow(self):
+        """Open one extra session on a slot reserved by the caller"""
+        try:
+            await self._add_session()
+        except Exception as e:
+            print(f"[SESSIONS] Failed to open extra media session for DC {self.dc_id}: {e}")
+        finally:
+            self._creating -= 1
+
+    async def _add_session(self) -> PooledSession:
+        pooled = PooledSession(await create_media_session(self.client, self.dc_id))
+        self.sessions.append(pooled)
+        print(f"[SESSIONS] DC {self.dc_id}: {len(self.sessions)}/{self.size} media sessions")
+        return pooled
+
+    def _drop_dead(self):
+        for pooled in [s for s in self.sessions if s.dead]:
+            self._remove(pooled)
+
+    def _remove(self, pooled: PooledSession):
+        if pooled in self.sessions:
+            self.sessions.remove(pooled)
+            asyncio.ensure_future(_stop_quietly(pooled.session))
+            print(f"[SESSIONS] DC {self.dc_id}: dropped media session ({len(self.sessions)} left)")
+
+    async def health_check(self):
+        """Ping idle sessions, drop dead ones and reap those idle too long"""
+        now = time.monotonic()
+        for pooled in list(self.sessions):
+            if pooled.outstanding:
+                continue
+            # Failover can push the pool past `size`; trim those extras first
+            over_size = len(self.sessions) > self.size
+            if len(self.sessions) > 1 and (over_size or now - pooled.last_used > self.idle_timeout):
+                self._remove(pooled)
+                continue
+            try:
+                await pooled.session.invoke(
+                    raw.functions.Ping(ping_id=0), retries=0, timeout=HEALTH_CHECK_TIMEOUT
+                )
+            except Exception:
+                pooled.dead = True
+        self._drop_dead()
+
+    async def close(self):
+        sessions, self.sessions = self.sessions, []
+        await asyncio.gather(*(_stop_quietly(s.session) for s in sessions))
+
+    def stats(self) -> dict:
+        return {
+            'sessions': len(self.sessions),
+            'size': self.size,
+            'outstanding': [s.outstanding for s in self.sessions],
+        }
+
+
+async def _stop_quietly(session: Session):
+    try:
+        await session.stop()
+    except Exception as e:
+        print(f"[SESSIONS] Error stopping media session: {e}")
+
+
+async def create_media_session(client, dc_id: int) -> Session:
+    """Start a media session for `dc_id`, importing authorization on foreign DCs"""
+    test_mode = await client.storage.test_mode()
+
+    if dc_id != await client.storage.dc_id():
+        media_session = Session(
+            client,
+            dc_id,
+            await Auth(client, dc_id, test_mode).create(),
+            test_mode,
+            is_media=True
+        )
+        await media_session.start()
+
+        for _ in range(6):
+            try:
+                exported_auth = await client.invoke(
+                    raw.functions.auth.ExportAuthorization(dc_id=dc_id)
+                )
+                await media_session.invoke(
+                    raw.functions.auth.ImportAuthorization(
+                        id=exported_auth.id,
+                        bytes=exported_auth.bytes
+                    )
+                )
+                break
+            except Exception as e:
+                print(f"[SESSIONS] Auth attempt failed: {e}")
+                continue
+    else:
+        # Same DC as bot
+        media_session = Session(
+            client,
+            dc_id,
+            await client.storage.auth_key(),
+            test_mode,
+            is_media=True
+        )
+        await media_session.start()
+
+    return media_session
+
+
+_health_task = None
+_clients = []
+
+async def get_media_session(client, file_id: FileId) -> MediaSessionPool:
+    """Get the media session pool for the file's DC"""
+    return await get_session_pool(client, file_id.dc_id)
+
+
+async def get_session_pool(client, dc_id: int) -> MediaSessionPool:
+    """Get the media session pool for `dc_id`, e.g. after FILE_MIGRATE"""
+    global _health_task
+
+    # Kept apart from client.media_sessions, which pyrogram uses for its own downloads
+    if not hasattr(client, 'media_session_pools'):
+        client.media_session_pools = {}
+        _clients.append(client)
+
+    pool = client.media_session_pools.get(dc_id)
+    if pool is None:
+        pool = MediaSessionPool(
+            client, dc_id, config.MEDIA_SESSIONS_PER_DC, config.MEDIA_SESSION_IDLE_TIMEOUT
+        )
+        client.media_session_pools[dc_id] = pool
+
+    if _health_task is None or _health_task.done():
+        _health_task = asyncio.ensure_future(_health_loop())
+
+    return pool
+
+
+def total_outstanding() -> int:
+    """GetFile requests currently in flight across every client and DC"""
+    return sum(
+        pool.outstanding
+        for client in _clients
+        for pool in client.media_session_pools.values()
+    )
+
+
+def pool_stats() -> dict:
+    """Stats of every media session pool, keyed by client and DC"""
+    return {
+        f"{client.name}/DC{dc_id}": pool.stats()
+        for client in _clients
+        for dc_id, pool in client.media_session_pools.items()
+    }
+
+
+async def close_media_sessions(client):
+    """Stop every pooled media session opened for `client`"""
+    pools = getattr(client, 'media_session_pools', {})
+    await asyncio.gather(*(pool.close() for pool in pools.values()))
+    pools.clear()
+
+
+async def _health_loop():
+    while True:
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+        for client in list(_clients):
+            for pool in list(client.media_session_pools.values()):
+                try:
+                    await pool.health_check()
+                except Exception as e:
+                    print(f"[SESSIONS] Health check failed for DC {pool.dc_id}: {e}")
@@ -0,0 +1,116 @@
+# ==================== api/streaming/singleflight.py ====================
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from config import config
+from api.streaming.readahead import FetchPart
+
+class ChunkCoalescer:
+    """
+    Collapse concurrent fetches of the same part into one upstream request.
+
+    The first caller for a (file, offset, limit) key starts the fetch; every
+    caller arriving while it is in flight awaits the same result. Finished
+    parts are kept in a small in-memory window for `ttl` seconds so viewers
+    a few seconds behind each other still share one fetch.
+    """
+
+    def __init__(self, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.upstream = 0
+        self.coalesced = 0
+        self._inflight = {}
+        self._waiters = {}
+        self._recent: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    def _get_recent(self, key) -> Optional[bytes]:
+        entry = self._recent.get(key)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        if expires_at < time.monotonic():
+            self._drop(key)
+            return None
+        self._recent.move_to_end(key)
+        return data
+
+    def _remember(self, key, data):
+        if self.max_bytes <= 0 or not data or key in self._recent:
+            return
+        self._recent[key] = (time.monotonic() + self.ttl, data)
+        self.total_bytes += len(data)
+        now = time.monotonic()
+        while self._recent and (
+            self.total_bytes > self.max_bytes
+            or next(iter(self._recent.values()))[0] < now
+        ):
+            self._drop(next(iter(self._recent)))
+
+    def _drop(self, key):
+        _, data = self._recent.pop(key)
+        self.total_bytes -= len(data)
+
+    async def fetch(self, key, fetch: FetchPart, offset: int, limit: int):
+        recent = self._get_recent(key)
+        if recent is not None:
+            self.coalesced += 1
+            return recent
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.upstream += 1
+            task = asyncio.ensure_future(fetch(offset, limit))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+        else:
+            self.coalesced += 1
+
+        # Shielded so one viewer disconnecting doesn't cancel the others' fetch;
+        # once the last waiter is gone the upstream request is cancelled too
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[key] == 1 and not task.done():
+                # Forget it now: the cancelled task only finishes later, and a
+                # caller arriving in between must start a fresh fetch
+                self._inflight.pop(key, None)
+                task.cancel()
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def _on_done(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is None:
+            self._remember(key, task.result())
+
+    def stats(self) -> dict:
+        return {
+            'inflight': len(self._inflight),
+            'recentChunks': len(self._recent),
+            'recentBytes': self.total_bytes,
+            'upstream': self.upstream,
+            'coalesced': self.coalesced,
+        }
+
+
+coalescer = ChunkCoalescer(config.STREAM_RECENT_TTL, config.STREAM_RECENT_MAX_MB * 1024 * 1024)
+
+
+def coalesced_fetch(fetch: FetchPart, unique_id: Optional[str]) -> FetchPart:
+    """Wrap a part fetcher so identical concurrent requests share one GetFile"""
+    if not unique_id:
+        return fetch
+
+    async def fetch_part(offset: int, limit: int):
+        return await coalescer.fetch((unique_id, offset, limit), fetch, offset, limit)
+
+    return fetch_part
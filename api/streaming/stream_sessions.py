@@ -0,0 +1,150 @@
+# ==================== api/streaming/stream_sessions.py ====================
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+from config import config
+from api.streaming.planner import CHUNK_SIZE, Part
+from api.streaming.readahead import FetchPart, delivery
+
+class StreamSession:
+    """
+    What we remember about one client playing one file between requests.
+
+    Players fetch long videos as a chain of range requests. The session
+    keeps the read-ahead of the last request alive for a few seconds; when
+    the next request starts where the previous one stopped it picks those
+    parts up instead of starting cold, and its window grows. A request
+    somewhere else counts as a seek: the warm parts are dropped and the
+    window shrinks.
+    """
+
+    def __init__(self, key: tuple, window: int):
+        self.key = key
+        self.window = window
+        self.position = None  # first byte after what was last delivered
+        self.generation = 0
+        self.sequential = 0
+        self.warm = {}  # (offset, limit) -> task
+        self.expires = 0.0
+
+    def begin(self, first: int) -> int:
+        """Start a new request at byte `first`; returns its generation"""
+        self.generation += 1
+        if self.position is not None:
+            ahead = max(self.window, len(self.warm)) * CHUNK_SIZE
+            if self.position - CHUNK_SIZE <= first <= self.position + ahead:
+                self.sequential += 1
+                self.window = min(self.window * 2, config.STREAM_READAHEAD_MAX)
+            else:
+                self.sequential = 0
+                self.window = max(self.window // 2, 1)
+                self.drop_warm()
+        self.position = first
+        self.touch()
+        return self.generation
+
+    def touch(self):
+        self.expires = time.monotonic() + config.STREAM_SESSION_TTL
+
+    def advance(self, generation: int, position: int):
+        if generation == self.generation:
+            self.position = position
+            self.touch()
+
+    def wrap(self, fetch: FetchPart) -> FetchPart:
+        """Serve parts from the warm read-ahead before asking `fetch`"""
+        # Not a coroutine function: the warm part must be claimed when the
+        # fetch is scheduled, before this request's own tasks get adopted
+        def fetch_part(offset: int, limit: int):
+            task = self.warm.pop((offset, limit), None)
+            if task is None or task.cancelled():
+                return fetch(offset, limit)
+            return _reuse(task, fetch, offset, limit)
+
+        return fetch_part
+
+    def adopt(self, generation: int, pending: List[Tuple[Part, asyncio.Task]],
+              fetch: FetchPart, file_size: int) -> List[Tuple[Part, asyncio.Task]]:
+        """
+        Keep a finished request's read-ahead warm for the next request.
+
+        Returns the pending fetches that were not adopted, for the caller to
+        cancel. When the request ran to completion on a sequential session,
+        the next `window` parts are fetched so the following range is warm.
+        """
+        if generation != self.generation:
+            return pending
+
+        kept = pending[:self.window]
+        for part, task in kept:
+            self.warm[(part.offset, part.limit)] = task
+
+        if not pending and self.sequential and self.position is not None:
+            offset = self.position - self.position % CHUNK_SIZE
+            while len(self.warm) < self.window and offset < file_size:
+                key = (offset, CHUNK_SIZE)
+                if key not in self.warm:
+                    self.warm[key] = asyncio.ensure_future(fetch(offset, CHUNK_SIZE))
+                offset += CHUNK_SIZE
+
+        self.touch()
+        return pending[self.window:]
+
+    def drop_warm(self):
+        tasks = list(self.warm.values())
+        self.warm.clear()
+        if tasks:
+            delivery.record_abandoned(tasks)
+        for task in tasks:
+            task.cancel()
+
+
+async def _reuse(task: asyncio.Task, fetch: FetchPart, offset: int, limit: int):
+    try:
+        return await task
+    except Exception:
+        # Fetch it again, with this request's retries
+        return await fetch(offset, limit)
+
+
+class StreamSessionRegistry:
+    """Stream sessions keyed by (client IP, file), expiring after a short TTL"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._sweeper = None
+
+    def get(self, client: str, unique_id: str) -> Optional[StreamSession]:
+        if not client or not unique_id or config.STREAM_SESSION_TTL <= 0:
+            return None
+
+        key = (client, unique_id)
+        session = self._sessions.get(key)
+        if session is None or session.expires < time.monotonic():
+            if session is not None:
+                session.drop_warm()
+            session = StreamSession(key, config.STREAM_READAHEAD)
+            self._sessions[key] = session
+
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.ensure_future(self._sweep_loop())
+        return session
+
+    async def _sweep_loop(self):
+        while self._sessions:
+            await asyncio.sleep(max(config.STREAM_SESSION_TTL / 2, 1))
+            now = time.monotonic()
+            for key, session in list(self._sessions.items()):
+                if session.expires < now:
+                    session.drop_warm()
+                    del self._sessions[key]
+
+    def stats(self) -> dict:
+        return {
+            'sessions': len(self._sessions),
+            'warmParts': sum(len(s.warm) for s in self._sessions.values()),
+        }
+
+
+stream_sessions = StreamSessionRegistry()
@@ -1,41 +1,50 @@
 # ==================== api/utils.py ====================
 from bot.client import get_bot
+from config import config
+from fastapi import Request
 from pyrogram.errors import RPCError
 from typing import AsyncGenerator
+from contextlib import aclosing
+from api.streaming.buffers import Chunk
+from api.streaming.fetcher import TelegramSource
+from api.streaming.ranges import stream_bytes
 
-async def stream_file(file_id: str, start: int = 0, end: int = None) -> AsyncGenerator[bytes, None]:
+def client_ip(request: Request) -> str:
+    """
+    Address of the client behind `request`.
+
+    Behind a reverse proxy every request comes from the proxy, so the header
+    named by FORWARDED_IP_HEADER is trusted instead when it is configured.
+    """
+    if config.FORWARDED_IP_HEADER:
+        forwarded = request.headers.get(config.FORWARDED_IP_HEADER, '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.client.host if request.client else ''
+
+async def stream_file(file_id: str, start: int = 0, end: int = None) -> AsyncGenerator[Chunk, None]:
     """
     Stream a file from Telegram in chunks.
 
+    Uses the same media sessions, read-ahead and zero-copy slicing as the
+    /{fileId} and /dl/{fileId} routes.
+
     Args:
         file_id (str): Telegram file ID.
         start (int): Start byte.
-        end (int | None): End byte (optional).
+        end (int | None): End byte, exclusive (optional).
 
     Yields:
-        bytes: Chunks of the file.
+        bytes | memoryview: Chunks of the file.
     """
     bot = get_bot()  # get current active bot instance
+    source = TelegramSource(bot, {'telegramFileId': file_id}, file_id)
     try:
-        # You may need to adjust based on how you want chunking; here's a generic example
-        chunk_size = 1024 * 1024  # 1MB chunks
-        offset = start
-
-        while True:
-            remaining = (end - offset) if end else chunk_size
-            chunk = await bot.download_media(
-                file_id,
-                in_memory=True,
-                file_size=min(chunk_size, remaining)
-            )
-
-            if not chunk:
-                break
-
-            yield chunk
-            offset += len(chunk)
-            if end and offset >= end:
-                break
+        async with aclosing(stream_bytes(
+            source.fetch, start, end - 1 if end else None, config.STREAM_READAHEAD
+        )) as chunks:
+            async for chunk in chunks:
+                yield chunk
 
     except RPCError as e:
         print(f"[UTILS] Error streaming file {file_id}: {e}")
@@ -5,6 +5,9 @@ from config import config
 # Global bot variable (will be set by main.py)
 bot = None
 
+class BotNotReady(RuntimeError):
+    """The bot client has not been set up yet"""
+
 def create_bot():
     """Create and return bot client instance"""
     return Client(
@@ -25,5 +28,5 @@ def set_bot(client):
 def get_bot():
     """Get the global bot instance"""
     if bot is None:
-        raise RuntimeError("Bot not initialized. Call set_bot() first.")
+        raise BotNotReady("Bot not initialized. Call set_bot() first.")
     return bot
\ No newline at end of file
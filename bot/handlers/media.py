@@ -3,9 +3,12 @@ from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from bot.client import get_bot
 from database.operations import (
     add_file_to_folder, get_folder_by_id, parse_caption_format,
-    get_or_create_folder_by_name, get_or_create_quality_folder
+    get_or_create_folder_by_name, get_or_create_quality_folder,
+    set_file_channel_message
 )
 from config import config
+from api.streaming.hotstart import queue_hot_start
+from api.streaming.seekindex import seek_index
 import re
 from utils.master_id import get_base_name_from_filename
 
@@ -181,6 +184,11 @@ async def handle_media(client, message: Message):
             await message.reply_text("⚠️ Failed to save file.")
             return
         
+        # Keep the head and tail of the upload locally so its first view starts instantly,
+        # and index its keyframes so ?t= links can start mid-file
+        queue_hot_start({**file_doc, '_id': mongo_id})
+        seek_index.queue({**file_doc, '_id': mongo_id})
+        
         try:
             bot = get_bot()
             
@@ -224,13 +232,17 @@ async def handle_media(client, message: Message):
                 channel_caption += f"\n✅ **Auto-parsed from caption**"
             
             if config.CHANNEL_ID:
-                await bot.copy_message(
+                channel_message = await bot.copy_message(
                     chat_id=config.CHANNEL_ID,
                     from_chat_id=message.chat.id,
                     message_id=message.id,
                     caption=channel_caption
                 )
                 print(f"[MEDIA] File forwarded to channel: {file_name}")
+                
+                # Streaming workers resolve their own file IDs from this copy
+                if channel_message:
+                    await set_file_channel_message(mongo_id, channel_message.id)
             
         except Exception as e:
             print(f"[MEDIA] Error forwarding to channel: {e}")
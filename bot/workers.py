@@ -0,0 +1,211 @@
+# ==================== bot/workers.py ====================
+import asyncio
+import itertools
+from collections import OrderedDict
+from typing import List, Tuple
+
+from pyrogram import Client
+from config import config
+from bot.client import get_bot
+from database.operations import (
+    get_files_without_channel_message, mark_files_without_channel_copy,
+    set_file_channel_message, update_file_reference
+)
+
+RESOLVED_CACHE_SIZE = 4096
+CHANNEL_SCAN_BATCH = 200  # get_messages maximum
+CHANNEL_SCAN_GAP = 1000  # message IDs in a row without media that end the backfill scan
+
+# Streaming-only clients started from config.STREAM_BOT_TOKENS
+workers: List[Client] = []
+
+# (worker name, Mongo file ID) -> telegramFileId valid for that worker
+_resolved: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+_rotation = itertools.count()
+_backfill = None
+
+def create_worker(index: int, token: str) -> Client:
+    """Create a lightweight client used only for media reads"""
+    return Client(
+        name=f"telestore_worker_{index}",
+        api_id=config.API_ID,
+        api_hash=config.API_HASH,
+        bot_token=token,
+        workdir=".",
+        sleep_threshold=60,
+        no_updates=True,
+    )
+
+async def start_workers():
+    """Start one worker per extra bot token; failures are logged and skipped"""
+    for index, token in enumerate(config.STREAM_BOT_TOKENS, start=1):
+        worker = create_worker(index, token)
+        try:
+            await worker.start()
+            me = await worker.get_me()
+            workers.append(worker)
+            print(f"[WORKERS] Worker {index} started: @{me.username}")
+        except Exception as e:
+            print(f"[WORKERS] Failed to start worker {index}: {e}")
+
+    if workers:
+        print(f"[WORKERS] {len(workers)} streaming workers ready")
+
+    global _backfill
+    _backfill = asyncio.ensure_future(backfill_channel_messages())
+
+async def stop_workers():
+    from api.streaming.sessions import close_media_sessions
+
+    if _backfill and not _backfill.done():
+        _backfill.cancel()
+    while workers:
+        worker = workers.pop()
+        try:
+            await close_media_sessions(worker)
+            await worker.stop()
+        except Exception as e:
+            print(f"[WORKERS] Error stopping {worker.name}: {e}")
+
+async def backfill_channel_messages():
+    """
+    Link files stored before channel copies were recorded to their copy.
+
+    Workers and file-reference refreshes read a file through its channel
+    message. Bots can't list a channel's history, so messages are read by
+    ID from the start until a long run of IDs has no media, and each video
+    or document is matched to files by its unique ID. Files left over are
+    stored with a null channelMessageId so later startups skip them.
+    """
+    if not config.CHANNEL_ID:
+        return
+    try:
+        pending = {}
+        for file_data in await get_files_without_channel_message():
+            pending.setdefault(file_data['telegramFileUniqueId'], []).append(str(file_data['_id']))
+        if not pending:
+            return
+
+        bot = get_bot()
+        linked = 0
+        gap = 0
+        first = 1
+        while pending and gap < CHANNEL_SCAN_GAP:
+            messages = await bot.get_messages(config.CHANNEL_ID, list(range(first, first + CHANNEL_SCAN_BATCH)))
+            first += CHANNEL_SCAN_BATCH
+            for message in messages:
+                media = (message.video or message.document) if message and not message.empty else None
+                if media is None:
+                    gap += 1
+                    continue
+                gap = 0
+                for file_id in pending.pop(media.file_unique_id, []):
+                    await set_file_channel_message(file_id, message.id)
+                    linked += 1
+
+        unlinked = [file_id for ids in pending.values() for file_id in ids]
+        await mark_files_without_channel_copy(unlinked)
+        print(f"[WORKERS] Linked {linked} older files to their channel copies, {len(unlinked)} have none")
+    except Exception as e:
+        print(f"[WORKERS] Channel copy backfill failed: {e}")
+
+def client_load(client: Client) -> int:
+    """Outstanding media requests across all of a client's session pools"""
+    pools = getattr(client, 'media_session_pools', {})
+    return sum(pool.outstanding for pool in pools.values())
+
+def _media_file_id(message) -> str:
+    media = (message.video or message.document) if message and not message.empty else None
+    return media.file_id if media else None
+
+async def _store_file_id(client: Client, file_data: dict, file_id: str):
+    """Remember a freshly resolved file ID for `client`"""
+    from api.streaming.locations import resolver
+
+    if client is get_bot():
+        old_file_id = file_data.get('telegramFileId')
+        if old_file_id != file_id:
+            resolver.forget(old_file_id)
+            file_data['telegramFileId'] = file_id
+            await update_file_reference(str(file_data['_id']), file_id)
+        return
+
+    key = (client.name, str(file_data['_id']))
+    old_file_id = _resolved.get(key)
+    if old_file_id and old_file_id != file_id:
+        resolver.forget(old_file_id)
+    _resolved[key] = file_id
+    _resolved.move_to_end(key)
+    if len(_resolved) > RESOLVED_CACHE_SIZE:
+        _resolved.popitem(last=False)
+
+async def resolve_file_id(client: Client, file_data: dict, refresh: bool = False) -> str:
+    """
+    Resolve the client's own file ID for a stored file.
+
+    The main bot uses the stored telegramFileId; workers read the channel copy
+    of the file. With `refresh`, the channel copy is re-read for any client,
+    which also yields a fresh file_reference after Telegram expired the old one.
+    """
+    if not refresh:
+        if client is get_bot():
+            return file_data['telegramFileId']
+        file_id = _resolved.get((client.name, str(file_data['_id'])))
+        if file_id:
+            _resolved.move_to_end((client.name, str(file_data['_id'])))
+            return file_id
+
+    if not file_data.get('channelMessageId'):
+        raise ValueError(f"File {file_data.get('_id')} has no channel copy to resolve from")
+
+    message = await client.get_messages(config.CHANNEL_ID, file_data['channelMessageId'])
+    file_id = _media_file_id(message)
+    if not file_id:
+        raise ValueError(f"Channel message {file_data['channelMessageId']} has no media")
+
+    await _store_file_id(client, file_data, file_id)
+    return file_id
+
+async def refresh_file_ids(files: List[dict]):
+    """Re-read the channel copies of `files` in one call per client"""
+    files = [f for f in files if f.get('channelMessageId')]
+    if not files:
+        return
+
+    message_ids = [f['channelMessageId'] for f in files]
+    for client in [get_bot()] + workers:
+        try:
+            messages = await client.get_messages(config.CHANNEL_ID, message_ids)
+        except Exception as e:
+            print(f"[WORKERS] {client.name} could not refresh file references: {e}")
+            continue
+        for file_data, message in zip(files, messages):
+            file_id = _media_file_id(message)
+            if file_id:
+                await _store_file_id(client, file_data, file_id)
+
+async def get_streaming_client(file_data: dict) -> Tuple[Client, str]:
+    """
+    Pick the least loaded client able to read this file.
+
+    Returns the client and a telegramFileId valid for it. Workers are only
+    candidates for files that have a channel copy; the main bot is always
+    the fallback.
+    """
+    bot = get_bot()
+    candidates = [bot]
+    if workers and file_data.get('channelMessageId'):
+        candidates += workers
+
+    # Rotate before taking the minimum so ties are spread round-robin
+    start = next(_rotation) % len(candidates)
+    candidates = candidates[start:] + candidates[:start]
+    client = min(candidates, key=client_load)
+
+    if client is not bot:
+        try:
+            return client, await resolve_file_id(client, file_data)
+        except Exception as e:
+            print(f"[WORKERS] {client.name} could not resolve file {file_data.get('_id')}: {e}")
+
+    return bot, file_data['telegramFileId']
@@ -1,6 +1,7 @@
 # ==================== config.py ====================
 import os
 from dataclasses import dataclass
+from typing import List
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -23,6 +24,55 @@ class Config:
     # Channel (for updates, announcements)
     CHANNEL_ID: int
     LOGS_CHANNEL_ID: int
+
+    # Streaming
+    STREAM_READAHEAD: int  # GetFile requests kept in flight per stream
+    STREAM_PRECISE_MAX_KB: int  # ranges up to this size fetch only the bytes they need
+    CHUNK_CACHE_DIR: str
+    CHUNK_CACHE_MAX_MB: int  # 0 disables the on-disk chunk cache
+    STREAM_RECENT_TTL: float  # seconds a fetched part stays shareable in memory
+    STREAM_RECENT_MAX_MB: int
+    MEDIA_SESSIONS_PER_DC: int
+    MEDIA_SESSION_IDLE_TIMEOUT: float  # seconds before an extra idle session is closed
+    STREAM_BOT_TOKENS: List[str]  # extra bots used only to read media
+    LOCATION_CACHE_SIZE: int  # decoded file IDs / locations kept in memory
+    FILE_REFERENCE_HOT_FILES: int  # recently streamed files kept fresh in the background
+    FILE_REFERENCE_REFRESH_INTERVAL: float  # seconds between bulk refreshes, 0 disables
+    STREAM_FETCH_TIMEOUT: float  # seconds before one GetFile attempt is abandoned
+    STREAM_FETCH_RETRIES: int
+    DC_BREAKER_THRESHOLD: int  # consecutive failures that open a DC's circuit, 0 disables
+    DC_BREAKER_COOLDOWN: float
+    STREAM_HEDGE_PERCENTILE: float  # hedge GetFile calls slower than this latency percentile, 0 disables
+    STREAM_HEDGE_BUDGET: float  # max extra load from hedges, in percent
+    MEDIA_DC_RATE: float  # GetFile requests/s per account and DC, 0 = unlimited
+    MEDIA_DC_BURST: float  # defaults to MEDIA_DC_RATE
+    MEDIA_SESSION_RATE: float  # GetFile requests/s per media session, 0 = unlimited
+    MEDIA_DC_MAX_INFLIGHT: int  # GetFile requests in flight per account and DC before fair queueing, 0 = unlimited
+    STREAM_MAX_FLOOD_WAIT: float  # longer FloodWaits fail the request instead of pausing
+    STREAM_PACE_AHEAD: float  # seconds of playback sent ahead of the viewer, 0 = unpaced
+    FAIR_WATCH_WEIGHT: float  # share of a watching client relative to a downloading one
+    FAIR_CLIENT_MAX_INFLIGHT: int  # parts one client IP may fetch at once, 0 = unlimited
+    FORWARDED_IP_HEADER: str  # e.g. X-Forwarded-For when behind a reverse proxy
+    ADMISSION_MAX_STREAMS: int  # concurrent streams/downloads, 0 = unlimited
+    ADMISSION_MAX_PER_IP: int
+    ADMISSION_QUEUE_SIZE: int  # requests waiting for a slot before 503s
+    ADMISSION_QUEUE_TIMEOUT: float
+    ADMISSION_MAX_LOOP_LAG_MS: float  # shed new streams above this event-loop lag
+    ADMISSION_MAX_UPSTREAM: int  # shed new streams above this many GetFile in flight
+    STREAM_SESSION_TTL: float  # seconds a viewer's read-ahead stays warm between requests, 0 = off
+    STREAM_READAHEAD_MAX: int  # read-ahead window reached by sequential playback
+    STREAM_PREFETCH_HEAD_MB: int  # MB prefetched from the start of a file when its player opens, 0 = off
+    HOT_START_DIR: str
+    HOT_START_HEAD_MB: int  # MB of every upload captured at ingest, plus its last MB
+    HOT_START_MAX_MB: int  # 0 disables the hot-start store
+    FASTSTART_CACHE_MB: int  # patched MP4 headers kept in memory, 0 serves MP4s as stored
+    FFMPEG_PATH: str
+    HLS_WORKERS: int  # ffmpeg processes remuxing MKV at once, 0 disables HLS
+    HLS_SEGMENT_SECONDS: int
+    HLS_AHEAD_SEGMENTS: int  # segments remuxed ahead of the one being played
+    HLS_AUDIO_CODEC: str  # "copy", or e.g. "aac" for audio browsers can't decode
+    HLS_CACHE_DIR: str
+    HLS_CACHE_MAX_MB: int
     @staticmethod
     def load() -> "Config":
         return Config(
@@ -39,6 +89,55 @@ class Config:
 >>>>>>> origin/main
             BASE_APP_URL=os.getenv("BASE_APP_URL", "http://localhost:8000"),
             PORT=int(os.getenv("PORT", "8000")),
+            STREAM_READAHEAD=int(os.getenv("STREAM_READAHEAD", "4")),
+            STREAM_PRECISE_MAX_KB=int(os.getenv("STREAM_PRECISE_MAX_KB", "1024")),
+            CHUNK_CACHE_DIR=os.getenv("CHUNK_CACHE_DIR", "cache/chunks"),
+            CHUNK_CACHE_MAX_MB=int(os.getenv("CHUNK_CACHE_MAX_MB", "2048")),
+            STREAM_RECENT_TTL=float(os.getenv("STREAM_RECENT_TTL", "10")),
+            STREAM_RECENT_MAX_MB=int(os.getenv("STREAM_RECENT_MAX_MB", "64")),
+            MEDIA_SESSIONS_PER_DC=int(os.getenv("MEDIA_SESSIONS_PER_DC", "4")),
+            MEDIA_SESSION_IDLE_TIMEOUT=float(os.getenv("MEDIA_SESSION_IDLE_TIMEOUT", "300")),
+            STREAM_BOT_TOKENS=[t.strip() for t in os.getenv("STREAM_BOT_TOKENS", "").split(",") if t.strip()],
+            LOCATION_CACHE_SIZE=int(os.getenv("LOCATION_CACHE_SIZE", "4096")),
+            FILE_REFERENCE_HOT_FILES=int(os.getenv("FILE_REFERENCE_HOT_FILES", "500")),
+            FILE_REFERENCE_REFRESH_INTERVAL=float(os.getenv("FILE_REFERENCE_REFRESH_INTERVAL", "1800")),
+            STREAM_FETCH_TIMEOUT=float(os.getenv("STREAM_FETCH_TIMEOUT", "10")),
+            STREAM_FETCH_RETRIES=int(os.getenv("STREAM_FETCH_RETRIES", "4")),
+            DC_BREAKER_THRESHOLD=int(os.getenv("DC_BREAKER_THRESHOLD", "8")),
+            DC_BREAKER_COOLDOWN=float(os.getenv("DC_BREAKER_COOLDOWN", "30")),
+            STREAM_HEDGE_PERCENTILE=float(os.getenv("STREAM_HEDGE_PERCENTILE", "95")),
+            STREAM_HEDGE_BUDGET=float(os.getenv("STREAM_HEDGE_BUDGET", "5")),
+            MEDIA_DC_RATE=float(os.getenv("MEDIA_DC_RATE", "0")),
+            MEDIA_DC_BURST=float(os.getenv("MEDIA_DC_BURST", os.getenv("MEDIA_DC_RATE", "0"))),
+            MEDIA_SESSION_RATE=float(os.getenv("MEDIA_SESSION_RATE", "0")),
+            MEDIA_DC_MAX_INFLIGHT=int(os.getenv(
+                "MEDIA_DC_MAX_INFLIGHT", str(4 * int(os.getenv("MEDIA_SESSIONS_PER_DC", "4")))
+            )),
+            STREAM_MAX_FLOOD_WAIT=float(os.getenv("STREAM_MAX_FLOOD_WAIT", "60")),
+            STREAM_PACE_AHEAD=float(os.getenv("STREAM_PACE_AHEAD", "0")),
+            FAIR_WATCH_WEIGHT=float(os.getenv("FAIR_WATCH_WEIGHT", "4")),
+            FAIR_CLIENT_MAX_INFLIGHT=int(os.getenv("FAIR_CLIENT_MAX_INFLIGHT", "8")),
+            FORWARDED_IP_HEADER=os.getenv("FORWARDED_IP_HEADER", ""),
+            ADMISSION_MAX_STREAMS=int(os.getenv("ADMISSION_MAX_STREAMS", "200")),
+            ADMISSION_MAX_PER_IP=int(os.getenv("ADMISSION_MAX_PER_IP", "16")),
+            ADMISSION_QUEUE_SIZE=int(os.getenv("ADMISSION_QUEUE_SIZE", "100")),
+            ADMISSION_QUEUE_TIMEOUT=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+            ADMISSION_MAX_LOOP_LAG_MS=float(os.getenv("ADMISSION_MAX_LOOP_LAG_MS", "500")),
+            ADMISSION_MAX_UPSTREAM=int(os.getenv("ADMISSION_MAX_UPSTREAM", "256")),
+            STREAM_SESSION_TTL=float(os.getenv("STREAM_SESSION_TTL", "15")),
+            STREAM_READAHEAD_MAX=int(os.getenv("STREAM_READAHEAD_MAX", "8")),
+            STREAM_PREFETCH_HEAD_MB=int(os.getenv("STREAM_PREFETCH_HEAD_MB", "4")),
+            HOT_START_DIR=os.getenv("HOT_START_DIR", "cache/hotstart"),
+            HOT_START_HEAD_MB=int(os.getenv("HOT_START_HEAD_MB", "4")),
+            HOT_START_MAX_MB=int(os.getenv("HOT_START_MAX_MB", "2048")),
+            FASTSTART_CACHE_MB=int(os.getenv("FASTSTART_CACHE_MB", "64")),
+            FFMPEG_PATH=os.getenv("FFMPEG_PATH", "ffmpeg"),
+            HLS_WORKERS=int(os.getenv("HLS_WORKERS", "2")),
+            HLS_SEGMENT_SECONDS=int(os.getenv("HLS_SEGMENT_SECONDS", "6")),
+            HLS_AHEAD_SEGMENTS=int(os.getenv("HLS_AHEAD_SEGMENTS", "2")),
+            HLS_AUDIO_CODEC=os.getenv("HLS_AUDIO_CODEC", "copy"),
+            HLS_CACHE_DIR=os.getenv("HLS_CACHE_DIR", "cache/hls"),
+            HLS_CACHE_MAX_MB=int(os.getenv("HLS_CACHE_MAX_MB", "2048")),
         )
 
 config = Config.load()
@@ -589,6 +589,69 @@ async def increment_downloads(file_id: str):
     except InvalidId:
         pass
 
+async def set_file_channel_message(file_id: str, channel_message_id: int):
+    """Remember the channel copy of a file so other bot accounts can resolve it"""
+    db = get_database()
+    try:
+        await db.files.update_one(
+            {'_id': ObjectId(file_id)},
+            {'$set': {'channelMessageId': channel_message_id}}
+        )
+    except InvalidId:
+        pass
+
+async def get_files_without_channel_message() -> List[dict]:
+    """Files stored before their channel copy was recorded, and not yet looked up"""
+    db = get_database()
+    cursor = db.files.find(
+        {'channelMessageId': {'$exists': False}, 'telegramFileUniqueId': {'$exists': True}},
+        {'telegramFileUniqueId': 1}
+    )
+    return await cursor.to_list(length=None)
+
+async def mark_files_without_channel_copy(file_ids: List[str]):
+    """Record that the channel holds no copy of these files, so they aren't looked up again"""
+    db = get_database()
+    ids = [ObjectId(file_id) for file_id in file_ids if ObjectId.is_valid(file_id)]
+    if ids:
+        await db.files.update_many(
+            {'_id': {'$in': ids}, 'channelMessageId': {'$exists': False}},
+            {'$set': {'channelMessageId': None}}
+        )
+
+async def update_file_reference(file_id: str, telegram_file_id: str):
+    """Store a telegramFileId carrying a fresh file_reference"""
+    db = get_database()
+    try:
+        await db.files.update_one(
+            {'_id': ObjectId(file_id)},
+            {'$set': {'telegramFileId': telegram_file_id}}
+        )
+    except InvalidId:
+        pass
+
+async def get_seek_index(unique_id: str) -> Optional[dict]:
+    """Keyframe index of a Telegram file, shared by every folder holding it"""
+    db = get_database()
+    return await db.seekIndexes.find_one({'_id': unique_id})
+
+async def save_seek_index(unique_id: str, index: dict):
+    db = get_database()
+    await db.seekIndexes.replace_one(
+        {'_id': unique_id},
+        {**index, '_id': unique_id, 'createdAt': datetime.utcnow()},
+        upsert=True
+    )
+
+async def get_master_group_variants(master_group_id: str) -> List[Dict]:
+    """Every quality of a master group, whichever way the group was recorded"""
+    db = get_database()
+    cursor = db.files.find({'$or': [
+        {'masterGroupId': master_group_id},
+        {'parent_master_group_id': master_group_id},
+    ]})
+    return await cursor.to_list(length=None)
+
 async def get_all_users() -> List[int]:
     db = get_database()
     
@@ -7,7 +7,18 @@ from pyrogram import Client, idle
 from database.connection import connect_db, disconnect_db
 from config import config
 from bot.client import set_bot
-from api.routes import stream, download, api_endpoints
+from bot.workers import start_workers, stop_workers
+from api.routes import stream, download, api_endpoints, hls
+from api.streaming.admission import admission
+from api.streaming.buffers import allocations
+from api.streaming.cache import chunk_cache
+from api.streaming.hls import remuxer
+from api.streaming.hotstart import hot_store
+from api.streaming.readahead import delivery
+from api.streaming.scheduler import scheduler_stats
+from api.streaming.sessions import close_media_sessions, pool_stats
+from api.streaming.singleflight import coalescer
+from api.streaming.stream_sessions import stream_sessions
 
 bot = None
 idle_task = None
@@ -39,6 +50,9 @@ async def lifespan(app: FastAPI):
     await bot.start()
     me = await bot.get_me()
     print(f"[STARTUP] Bot started: @{me.username}")
+    
+    await start_workers()
+    
     print(f"[STARTUP] API server running on port {config.PORT}")
     print(f"[STARTUP] Base URL: {config.BASE_APP_URL}")
     print(f"[STARTUP] Channel ID: {config.CHANNEL_ID}")
@@ -56,6 +70,8 @@ async def lifespan(app: FastAPI):
             await idle_task
         except asyncio.CancelledError:
             pass
+    await stop_workers()
+    await close_media_sessions(bot)
     await bot.stop()
     await disconnect_db()
     print("[SHUTDOWN] Shutdown complete")
@@ -89,12 +105,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Seek-Time", "X-Seek-Offset"],
 )
 
-app.include_router(stream.router)
-app.include_router(download.router)
-app.include_router(api_endpoints.router)
-
 @app.get("/")
 async def root():
     """API root endpoint"""
@@ -107,7 +120,8 @@ async def root():
             "stream": "/{fileId} - Direct video stream with range support",
             "watch": "/watch/{fileId} - Beautiful embedded video player",
             "download": "/dl/{fileId} - Direct file download",
-            "health": "/health - Health check endpoint"
+            "health": "/health - Health check endpoint",
+            "stats": "/stats - Streaming pipeline counters"
         },
         "features": [
             "Video streaming with seeking",
@@ -130,6 +144,29 @@ async def health_check():
         "version": "2.0.0"
     }
 
+@app.get("/stats")
+async def streaming_stats():
+    """Counters of every stage of the streaming pipeline"""
+    return {
+        "admission": admission.stats(),
+        "schedulers": scheduler_stats(),
+        "mediaSessions": pool_stats(),
+        "coalescer": coalescer.stats(),
+        "chunkCache": chunk_cache.stats(),
+        "hotStart": hot_store.stats(),
+        "streamSessions": stream_sessions.stats(),
+        "delivery": delivery.stats(),
+        "buffers": allocations.stats(),
+        "hls": remuxer.stats(),
+    }
+
+# Mounted after the app's own routes: stream's /{fileId} would otherwise
+# swallow /health and /stats
+app.include_router(hls.router)
+app.include_router(stream.router)
+app.include_router(download.router)
+app.include_router(api_endpoints.router)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
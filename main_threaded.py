@@ -578,7 +578,9 @@ app.add_middleware(
 )
 
 # Include routes
-from api.routes import stream, download
+from api.routes import stream, download, hls
+# Before stream's /{fileId}: the player sends MKV to /hls when ffmpeg is installed
+app.include_router(hls.router)
 app.include_router(stream.router)
 app.include_router(download.router)
 
@@ -0,0 +1,127 @@
+# ==================== tests/test_hls.py ====================
+import asyncio
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+from config import config
+from api.streaming import hls
+from api.streaming.hls import Segment, plan_segments, remux, remux_url, retime, split_fmp4, track_timescales
+from api.streaming.mp4 import find, full_box
+from api.streaming.seekindex import index_mkv
+
+FPS = 25
+SEGMENT_SECONDS = 6.0
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="needs ffmpeg")
+
+def box(kind: bytes, payload: bytes = b'') -> bytes:
+    return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+
+def video_frames(media: bytes) -> int:
+    """Samples across every trun of a media segment"""
+    return sum(
+        struct.unpack_from('>I', media, trun.body + 4)[0]
+        for trun in find(media, [b'moof', b'traf', b'trun'])
+    )
+
+
+def start_times(init: bytes, media: bytes) -> dict:
+    """Track ID -> seconds of the first tfdt of that track in `media`"""
+    timescales = track_timescales(init)
+    starts = {}
+    for traf in find(media, [b'moof', b'traf']):
+        tfhd = find(media, [b'tfhd'], traf.body, traf.end)[0]
+        tfdt = find(media, [b'tfdt'], traf.body, traf.end)[0]
+        track_id = struct.unpack_from('>I', media, full_box(media, tfhd)[2])[0]
+        version, _, pos = full_box(media, tfdt)
+        decode_time = struct.unpack_from('>Q' if version == 1 else '>I', media, pos)[0]
+        starts.setdefault(track_id, decode_time / timescales[track_id])
+    return starts
+
+
+def test_segment_window_is_an_input_option(monkeypatch):
+    seen = []
+
+    async def fake_run(args, feed=None):
+        seen.append(args)
+        return b''
+
+    monkeypatch.setattr(hls, 'run_ffmpeg', fake_run)
+    asyncio.run(remux_url('in.mp4', Segment(2, 6.0, 6.0, 0, 0)))
+    args = seen[0]
+    assert args.index('-ss') < args.index('-i')
+    assert args.index('-t') < args.index('-i')
+
+
+def test_source_only_serves_our_ffmpeg():
+    key = hls.source_url('0' * 24).split('key=')[1]
+    assert hls.is_source_request('127.0.0.1', key)
+    assert not hls.is_source_request('127.0.0.1', '')
+    assert not hls.is_source_request('203.0.113.7', key)
+
+
+def test_retime_places_fragments_at_the_segment_start():
+    tkhd = box(b'tkhd', struct.pack('>I', 0) + struct.pack('>III', 0, 0, 1) + bytes(68))
+    mdhd = box(b'mdhd', struct.pack('>I', 0) + struct.pack('>IIII', 0, 0, 12800, 0) + bytes(4))
+    init = box(b'moov', box(b'trak', tkhd + box(b'mdia', mdhd)))
+
+    def fragment(decode_time: int) -> bytes:
+        tfhd = box(b'tfhd', struct.pack('>II', 0, 1))
+        tfdt = box(b'tfdt', struct.pack('>IQ', 1 << 24, decode_time))
+        return box(b'moof', box(b'traf', tfhd + tfdt)) + box(b'mdat')
+
+    media = retime(init, fragment(0) + fragment(25600), 12.0)
+    decode_times = [
+        struct.unpack_from('>Q', media, full_box(media, tfdt)[2])[0]
+        for tfdt in find(media, [b'moof', b'traf', b'tfdt'])
+    ]
+    assert decode_times == [12 * 12800, 14 * 12800]
+
+
+def make_source(path, *extra):
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', f'testsrc=duration=18:size=320x240:rate={FPS}',
+        '-c:v', 'mpeg4', '-g', str(2 * FPS), *extra, str(path),
+    ], check=True)
+
+
+@needs_ffmpeg
+def test_remux_later_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'FFMPEG_PATH', 'ffmpeg')
+    source = tmp_path / 'in.mp4'
+    make_source(source)
+
+    for number in (1, 2, 3):
+        segment = Segment(number, (number - 1) * SEGMENT_SECONDS, SEGMENT_SECONDS, 0, 0)
+        init, media = split_fmp4(asyncio.run(remux_url(str(source), segment)), segment.start)
+        assert video_frames(media) == SEGMENT_SECONDS * FPS
+        for seconds in start_times(init, media).values():
+            assert seconds == pytest.approx(segment.start, abs=0.05)
+
+
+@needs_ffmpeg
+def test_remux_mkv_segments_start_in_place(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'FFMPEG_PATH', 'ffmpeg')
+    source = tmp_path / 'in.mkv'
+    make_source(source, '-cluster_time_limit', '2000')
+    data = source.read_bytes()
+
+    async def fetch(offset, limit):
+        return data[offset:offset + limit]
+
+    async def run():
+        index = await index_mkv(fetch, len(data))
+        head_end = index.header_ranges[0][1] + 1
+        segments = plan_segments(index, len(data), SEGMENT_SECONDS)
+        return [(s, await remux(fetch, head_end, s, 1)) for s in segments]
+
+    results = asyncio.run(run())
+    assert len(results) > 1
+    for segment, out in results:
+        init, media = split_fmp4(out, segment.start)
+        for seconds in start_times(init, media).values():
+            assert seconds == pytest.approx(segment.start, abs=0.05)
@@ -0,0 +1,28 @@
+# ==================== tests/test_scheduler.py ====================
+import asyncio
+
+from api.streaming.scheduler import DCScheduler, Flow, Priority
+
+def test_saturated_dc_serves_viewers_before_downloads():
+    async def run():
+        scheduler = DCScheduler('test/DC1', 0, 0, max_inflight=2)
+        order = []
+
+        async def fetch(flow: Flow, name: str):
+            async with scheduler.slot(flow):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        download = Flow(Priority.DOWNLOAD, '198.51.100.1', 'file')
+        watch = Flow(Priority.PLAYBACK, '203.0.113.7', 'file')
+        tasks = [asyncio.ensure_future(fetch(download, 'download')) for _ in range(10)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.ensure_future(fetch(watch, 'watch')) for _ in range(4)]
+        await asyncio.gather(*tasks)
+        assert scheduler.inflight == 0
+        return order
+
+    order = asyncio.run(run())
+    # Two downloads took the free slots; the queued viewer then goes ahead of the rest
+    assert order[:2] == ['download', 'download']
+    assert order[2:6].count('watch') >= 3
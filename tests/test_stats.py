@@ -0,0 +1,17 @@
+# ==================== tests/test_stats.py ====================
+from fastapi.testclient import TestClient
+
+from main import app
+
+client = TestClient(app)
+
+def test_stats_is_not_shadowed_by_the_stream_route():
+    response = client.get('/stats')
+    assert response.status_code == 200
+    body = response.json()
+    assert 'wastedBytes' in body['delivery']
+    assert 'hits' in body['chunkCache']
+
+
+def test_health_is_not_shadowed_by_the_stream_route():
+    assert client.get('/health').status_code == 200